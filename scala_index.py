@@ -0,0 +1,263 @@
+"""
+A reverse index of what uses what on the Content Manager, for finding what replacing or expiring a media
+item or playlist affects:
+
+    media -> playlists (and the playlists those are sub-playlists of) -> frames -> channels -> players
+
+The index keeps, for each player, channel, frame and playlist, what it directly refers to, as read from
+the CM: the channels of a player's displays, the frames of a channel, the playlists of a frame's
+timeslots and the items of a playlist. It derives the reverse lookups from those in memory, so impact
+queries don't touch the CM. It is saved to a JSON file and brought up to date with update(), which
+fetches again only what the CM reports as modified since the last update.
+
+Command line usage:
+    scala_index.py [-i FILE] [-u] [-w WORKERS] <media|playlist> <id or name>
+
+    Prints what uses the media item or playlist, as JSON. The index is built first if the file doesn't
+    exist, and brought up to date first with -u.
+"""
+import webservices.scws as scws
+import scala_monitor
+import json
+import os
+import sys
+from optparse import OptionParser
+
+def_filename = u'impact.json'
+version = 1
+
+
+class ImpactIndex:
+    """A reverse index of the content of the CM a ScalaMonitor is connected to, see the module
+    documentation. Ids are strings, as from the CM.
+    """
+    kinds = (u'player', u'channel', u'frame', u'playlist', u'media')
+
+    def __init__(self, monitor, filename=None):
+        self.monitor = monitor
+        self.filename = filename
+        self.indicators = None      #kind: { id : change indicator } as of the last update
+        self.names = dict((kind, {}) for kind in self.kinds)
+        self.displays = {}          #player id: [channel ids]
+        self.frames = {}            #channel id: [frame ids]
+        self.schedule = {}          #frame id: [playlist ids]
+        self.items = {}             #playlist id: {'media' : [media ids], 'playlists' : [sub-playlist ids]}
+        if filename and os.path.exists(filename):
+            self.load()
+        self._reverse()
+
+    def load(self):
+        with open(self.filename, u'rb') as infile:
+            data = json.load(infile)
+        if data.get(u'version') != version:
+            raise ValueError(u'%s: unknown index version %s' % (self.filename, data.get(u'version')))
+        for name in (u'indicators', u'names', u'displays', u'frames', u'schedule', u'items'):
+            setattr(self, name, data[name])
+
+    def save(self):
+        data = {u'version' : version}
+        for name in (u'indicators', u'names', u'displays', u'frames', u'schedule', u'items'):
+            data[name] = getattr(self, name)
+        tempname = self.filename + u'.tmp'     #don't leave a partial index
+        outfile = open(tempname, u'wb')
+        try:
+            json.dump(data, outfile)
+        finally:
+            outfile.close()
+        if os.name == u'nt' and os.path.exists(self.filename):
+            os.remove(self.filename)        #rename won't replace on win32
+        os.rename(tempname, self.filename)
+
+    def _read(self):
+        """Returns the current players, channels, playlists and media of the CM, one list call each."""
+        content_manager = self.monitor.content_manager
+        players = content_manager.PlayerRS.list()
+        self.monitor.registry.refresh(players)
+        channels, playlists = content_manager.batch([(u'ChannelRS.list',), (u'PlaylistRS.list',)],
+                                                    raise_errors=True)
+        media = list(content_manager.iter_list(u'MediaRS'))
+        return {u'player' : players, u'channel' : channels, u'playlist' : playlists, u'media' : media}
+
+    def _fetch(self, function, ids):
+        """Calls function for each id concurrently, returns { id : result }."""
+        results = scws.map_concurrent(function, ids, workers=self.monitor.workers)
+        for result in results:
+            if isinstance(result, Exception): raise result
+        return dict(zip(ids, results))
+
+    def update(self):
+        """Brings the index up to date with the CM, building it on first use, and saves it if it has a
+        file. Players, channels and playlists are fetched again only if their modification time or revision
+        changed; the timeslots of every frame are fetched again, as they have neither.
+
+        Returns the ids of what changed, { 'player' : [...], 'channel' : [...], 'frame' : [...],
+        'playlist' : [...] }, frames being those whose timeslots changed.
+        """
+        content_manager = self.monitor.content_manager
+        current = self._read()
+        indicators = dict((kind, scala_monitor.change_indicators(objs)) for kind, objs in current.items())
+        old = self.indicators or dict((kind, {}) for kind in indicators)
+        changed = {}
+        for kind, new in indicators.items():
+            changed[kind] = sorted(id for id in new if old[kind].get(id) != new[id] or new[id] is None)
+            for id in set(old[kind]) - set(new):
+                self.names[kind].pop(id, None)
+            for obj in current[kind]:
+                self.names[kind][obj.id] = obj.name
+
+        #players: the channels of their displays
+        for id in [id for id in self.displays if id not in indicators[u'player']]:
+            del self.displays[id]
+        displays = self._fetch(lambda id: content_manager.PlayerRS.getPlayerDisplays(playerId=id),
+                               changed[u'player'])
+        for id, found in displays.items():
+            self.displays[id] = sorted(set(display.channelId for display in found if display.channelId))
+
+        #channels: their frames
+        for id in [id for id in self.frames if id not in indicators[u'channel']]:
+            for frame_id in self.frames.pop(id):
+                self.schedule.pop(frame_id, None)
+                self.names[u'frame'].pop(frame_id, None)
+        frames = self._fetch(lambda id: content_manager.ChannelRS.getFrames(channelId=id), changed[u'channel'])
+        for id, found in frames.items():
+            for frame_id in set(self.frames.get(id, [])) - set(frame.id for frame in found):
+                self.schedule.pop(frame_id, None)
+                self.names[u'frame'].pop(frame_id, None)
+            self.frames[id] = [frame.id for frame in found]
+            for frame in found:
+                self.names[u'frame'][frame.id] = frame.name
+
+        #frames: the playlists of their timeslots
+        channel_of = dict((frame_id, channel_id) for channel_id, frame_ids in self.frames.items()
+                          for frame_id in frame_ids)
+        timeslots = self._fetch(lambda id: content_manager.ChannelRS.getTimeslots({u'channelId':channel_of[id]},
+                                                                                  frameId=id),
+                                sorted(channel_of))
+        changed[u'frame'] = []
+        for id, found in timeslots.items():
+            playlist_ids = sorted(set(t.playlistId for t in found if t.playlistId is not None))
+            if self.schedule.get(id) != playlist_ids:
+                self.schedule[id] = playlist_ids
+                changed[u'frame'].append(id)
+        changed[u'frame'].sort()
+
+        #playlists: their items, following sub-playlists not seen before
+        for id in [id for id in self.items if id not in indicators[u'playlist']]:
+            del self.items[id]
+        todo = changed[u'playlist']
+        while todo:
+            found = self._fetch(lambda id: content_manager.PlaylistRS.getPlaylistItems(playlistId=id), todo)
+            for id, items in found.items():
+                self.items[id] = {
+                    u'media' : sorted(set(item.mediaId for item in items
+                                          if item.playlistItemType in (u'MEDIA_ITEM', u'MESSAGE'))),
+                    u'playlists' : sorted(set(item.playlistId for item in items
+                                              if item.playlistItemType == u'SUB_PLAYLIST'))}
+            todo = sorted(set(id for entry in self.items.values() for id in entry[u'playlists']
+                              if id not in self.items and id in indicators[u'playlist']))
+
+        self.indicators = indicators
+        self._reverse()
+        if self.filename:
+            self.save()
+        return dict((kind, changed[kind]) for kind in (u'player', u'channel', u'frame', u'playlist'))
+
+    def _reverse(self):
+        """Derives the reverse lookups from what each player, channel, frame and playlist refers to."""
+        def add(index, key, value):
+            index.setdefault(key, set()).add(value)
+        self._media_playlists, self._playlist_parents, self._playlist_frames = {}, {}, {}
+        self._frame_channel, self._channel_players = {}, {}
+        for playlist_id, entry in self.items.items():
+            for media_id in entry[u'media']:
+                add(self._media_playlists, media_id, playlist_id)
+            for sub_id in entry[u'playlists']:
+                add(self._playlist_parents, sub_id, playlist_id)
+        for frame_id, playlist_ids in self.schedule.items():
+            for playlist_id in playlist_ids:
+                add(self._playlist_frames, playlist_id, frame_id)
+        for channel_id, frame_ids in self.frames.items():
+            for frame_id in frame_ids:
+                self._frame_channel[frame_id] = channel_id
+        for player_id, channel_ids in self.displays.items():
+            for channel_id in channel_ids:
+                add(self._channel_players, channel_id, player_id)
+
+    def find(self, kind, value):
+        """Returns the ids of kind ('media', 'playlist', ...) whose id or name is value."""
+        names = self.names[kind]
+        if value in names:
+            return [value]
+        return sorted(id for id, name in names.items() if name == value)
+
+    def playlists_using(self, playlist_ids=(), media_ids=()):
+        """Returns the ids of the playlists containing any of the given media items or playlists, directly
+        or through sub-playlists, and the given playlists themselves."""
+        found = set(playlist_ids)
+        for media_id in media_ids:
+            found.update(self._media_playlists.get(media_id, ()))
+        todo = list(found)
+        while todo:
+            for parent in self._playlist_parents.get(todo.pop(), ()):
+                if parent not in found:     #cycles end here
+                    found.add(parent)
+                    todo.append(parent)
+        return found
+
+    def impact(self, media_ids=(), playlist_ids=()):
+        """Returns what uses any of the given media items or playlists:
+        {'playlists' : [ids], including playlists using them as sub-playlists
+         'frames' : [ids], of frames with a timeslot for one of the playlists
+         'channels' : [ids],
+         'players' : [ids]
+        }
+        """
+        playlists = self.playlists_using(playlist_ids, media_ids)
+        frames = set(frame_id for playlist_id in playlists for frame_id in self._playlist_frames.get(playlist_id, ()))
+        channels = set(self._frame_channel[frame_id] for frame_id in frames if frame_id in self._frame_channel)
+        players = set(player_id for channel_id in channels for player_id in self._channel_players.get(channel_id, ()))
+        return {u'playlists' : sorted(playlists), u'frames' : sorted(frames),
+                u'channels' : sorted(channels), u'players' : sorted(players)}
+
+    def describe(self, impact):
+        """Returns impact() output with { 'id' : id, 'name' : name } in place of each id."""
+        kinds = {u'playlists' : u'playlist', u'frames' : u'frame', u'channels' : u'channel', u'players' : u'player'}
+        return dict((key, [{u'id' : id, u'name' : self.names[kinds[key]].get(id)} for id in ids])
+                    for key, ids in impact.items())
+
+
+def main():
+    parser = OptionParser(usage=__doc__)
+    parser.add_option(u'-i', u'--index', default=def_filename,
+        help=u'File to keep the index in (default: %default)')
+    parser.add_option(u'-u', u'--update', action=u'store_true', default=False,
+        help=u'Bring the index up to date with the CM first')
+    parser.add_option(u'-w', u'--workers', type=u'int', default=scws._def_workers,
+        help=u'Concurrent requests to the CM (default: %default)')
+    opts, args = parser.parse_args()
+    if len(args) != 2 or args[0] not in (u'media', u'playlist'):
+        parser.error(u'give media or playlist, and an id or name')
+
+    #read config file
+    try:
+        config = json.load(open(os.path.join(os.path.dirname(__file__), u'settings.json'), u'r'))
+    except IOError:
+        raise IOError(u'The settings.json file does not exist')
+
+    scala = scala_monitor.ScalaMonitor(config[u"baseurl"], config[u"authstring"], config[u"api"],
+                                       workers=opts.workers)
+    index = ImpactIndex(scala, opts.index)
+    if opts.update or index.indicators is None:
+        index.update()
+
+    ids = index.find(args[0], args[1].decode(sys.getfilesystemencoding() or u'utf-8'))
+    if not ids:
+        parser.error(u'%s %s not found' % (args[0], args[1]))
+    if args[0] == u'media':
+        impact = index.impact(media_ids=ids)
+    else:
+        impact = index.impact(playlist_ids=ids)
+    print json.dumps(index.describe(impact))
+
+if __name__ == '__main__':
+    main();
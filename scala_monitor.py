@@ -1,6 +1,15 @@
 import webservices.scws as scws
+import scala_schedule
+import bisect
+import heapq
 import json
 import os
+import random
+import sys
+import threading
+import time
+import Queue
+from optparse import OptionParser
 
 def human_filesize(filesize):
     """Takes a number of bytes and converts it to a human readable value.
@@ -13,59 +22,442 @@ def human_filesize(filesize):
     return "%3.1f%s" % (filesize, 'TB')
 
 
+def parse_duration(value):
+    """Takes a duration as given by the CM, either seconds or 'HH:MM:SS(.fff)', and returns seconds
+    as a float. Returns None if there's no duration.
+    """
+    if value is None or value == u'':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        seconds = 0.0
+        for part in value.split(u':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+
+
+class SnapshotCache:
+    """Memoizes lookups for the duration of a snapshot, shared between threads.
+
+    A key is fetched once: threads asking for a key that is being fetched wait for that fetch
+    rather than repeating it. Exceptions are remembered and raised to every caller.
+    """
+    def __init__(self):
+        self._values = {}
+        self._pending = {}      # key: threading.Event set when its value is in
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key, fetch):
+        """Returns the value of key, calling fetch() to get it the first time."""
+        with self._lock:
+            event = None
+            if key not in self._values:
+                event = self._pending.get(key)
+                owner = event is None
+                if owner:
+                    event = self._pending[key] = threading.Event()
+
+        if event is not None:
+            if owner:
+                try:
+                    value = fetch()
+                except Exception as e:
+                    value = e
+                with self._lock:
+                    self._values[key] = value
+                    del self._pending[key]
+                event.set()
+            else:
+                while not event.is_set():   #stay responsive to Ctrl-C
+                    event.wait(0.5)
+
+        value = self._values[key]
+        if isinstance(value, Exception): raise value
+        return value
+
+    def items(self):
+        """Returns a list of the (key, value) pairs fetched so far."""
+        with self._lock:
+            return self._values.items()
+
+    def set(self, key, value):
+        """Replaces the value of key."""
+        with self._lock:
+            self._values[key] = value
+
+    def discard(self, stale):
+        """Forgets the values of all keys for which stale(key) is true, so they are fetched again."""
+        with self._lock:
+            for key in [key for key in self._values if stale(key)]:
+                del self._values[key]
+
+    def discard_errors(self):
+        """Forgets the keys whose fetch raised, so they are fetched again. Returns those keys."""
+        with self._lock:
+            failed = [key for key, value in self._values.items() if isinstance(value, Exception)]
+            for key in failed:
+                del self._values[key]
+        return failed
+
+
+def diff_info(old, new, path=()):
+    """Returns the differences between two get_player_info() outputs, or parts of them, as a list of
+    {'path' : ['playlists', 'PL 1', 'items', 'file.png'],
+     'change' : 'added', 'removed' or 'changed',
+     'old' : <the value before, unless added>,
+     'new' : <the value now, unless removed>
+    }
+    """
+    if old is None and new is not None:
+        return [{u'path' : list(path), u'change' : u'added', u'new' : new}]
+    if new is None and old is not None:
+        return [{u'path' : list(path), u'change' : u'removed', u'old' : old}]
+    if isinstance(old, dict) and isinstance(new, dict):
+        out = []
+        for key in sorted(set(old) | set(new)):
+            if key not in old:
+                out.append({u'path' : list(path) + [key], u'change' : u'added', u'new' : new[key]})
+            elif key not in new:
+                out.append({u'path' : list(path) + [key], u'change' : u'removed', u'old' : old[key]})
+            else:
+                out.extend(diff_info(old[key], new[key], tuple(path) + (key,)))
+        return out
+    if old == new:
+        return []
+    return [{u'path' : list(path), u'change' : u'changed', u'old' : old, u'new' : new}]
+
+
+def change_indicators(items):
+    """Returns a dictionary of { 'id' : change indicator } of TObjs, the indicator being the last modification
+    time or revision. Items without either are always considered changed."""
+    return dict((item.id, item.lastModified or item.revision) for item in items)
+
+
+class PlaylistExpander:
+    """Flattens playlists into the media items they play, in play order.
+
+    Each playlist's items are fetched once and each playlist's flattened list is memoized, so a
+    sub-playlist shared by many parents costs one call per snapshot - use a new expander for each
+    snapshot. Sibling sub-playlists are fetched concurrently. A sub-playlist that refers back to
+    one of its parents is skipped and recorded in cycles as (parent id, sub-playlist id). What a
+    cycle cuts short depends on the parents, so a memoized list is only reused by callers none of
+    whose parents its playlists refer to, and the result doesn't depend on what was expanded first.
+    """
+    def __init__(self, content_manager, workers=scws._def_workers, cache=None):
+        self.content_manager = content_manager
+        self.workers = workers
+        self.cycles = []
+        self._items = cache or SnapshotCache()  # ('items', playlist id): list of PlaylistItemTO
+        self._expanded = {}     # playlist id: (list of entries, see expand(), ids of sub-playlists referred to)
+
+    def _fetch_items(self, playlist_id):
+        return self._items.get((u'items', playlist_id),
+            lambda: self.content_manager.PlaylistRS.getPlaylistItems(playlistId=playlist_id))
+
+    def prefetch(self, playlist_ids):
+        """Fetches the items of all playlists given that aren't known yet, concurrently."""
+        missing = []
+        for playlist_id in playlist_ids:
+            if (u'items', playlist_id) not in self._items and playlist_id not in missing:
+                missing.append(playlist_id)
+        #errors are remembered by the cache, get_items() raises them
+        scws.map_concurrent(self._fetch_items, missing, workers=self.workers)
+
+    def get_items(self, playlist_id):
+        """Returns the items of a playlist, in play order."""
+        items = self._fetch_items(playlist_id)
+        if not items: raise ValueError(u'No playlist found with id ' + playlist_id)
+
+        if all(item.sortOrder is not None for item in items):
+            items = sorted(items, key=lambda item: int(item.sortOrder))
+        return items
+
+    def expand(self, playlist_id, _parents=()):
+        """Returns the media items played by a playlist and its sub-playlists, in play order, as a list of
+        {'media_id' : '123',
+         'type' : 'MEDIA_ITEM' or 'MESSAGE',
+         'duration' : 10.0, in seconds, or None if not set
+         'playlist_id' : '45', the playlist directly containing the item
+         'disabled' : False
+        }
+        """
+        return self._expand(playlist_id, _parents)[0]
+
+    def _expand(self, playlist_id, parents):
+        """Returns expand() of a playlist, and the ids of the sub-playlists it and those below it refer to."""
+        found = self._expanded.get(playlist_id)
+        if found is not None and not found[1].intersection(parents):
+            return found
+
+        items = self.get_items(playlist_id)
+        parents = parents + (playlist_id,)
+        #fetch all sub-playlists of this one at once, before descending into the first
+        self.prefetch([item.playlistId for item in items
+                       if item.playlistItemType == u'SUB_PLAYLIST' and item.playlistId not in parents])
+
+        out = []
+        refers = set()
+        for item in items:
+            if item.playlistItemType == u'SUB_PLAYLIST':
+                refers.add(item.playlistId)
+                if item.playlistId in parents:
+                    self.cycles.append((playlist_id, item.playlistId))
+                    continue
+                entries, below = self._expand(item.playlistId, parents)
+                out.extend(entries)
+                refers.update(below)
+            elif item.playlistItemType == u'MEDIA_ITEM' or item.playlistItemType == u'MESSAGE':
+                out.append({u'media_id' : item.mediaId,
+                            u'type' : item.playlistItemType,
+                            u'duration' : parse_duration(item.duration),
+                            u'playlist_id' : playlist_id,
+                            u'disabled' : item.disabled == u'true'})
+            else:
+                raise ValueError(u'Playlist item ' + item.id + u' has unknown playlist type ' + item.playlistItemType)
+
+        if not refers.intersection(parents[:-1]):     #not cut short by a cycle through a caller
+            self._expanded[playlist_id] = (out, refers)
+        return out, refers
+
+    def loop_length(self, playlist_id):
+        """Returns the time one loop of a playlist takes, as a dictionary of
+        {'seconds' : 120.0, the sum of the durations of enabled items,
+         'items' : 12, the number of enabled items,
+         'unknown' : 1, the number of enabled items without a duration, not counted in seconds
+        }
+        """
+        entries = [entry for entry in self.expand(playlist_id) if not entry[u'disabled']]
+        durations = [entry[u'duration'] for entry in entries if entry[u'duration'] is not None]
+        return {u'seconds' : sum(durations),
+                u'items' : len(entries),
+                u'unknown' : len(entries) - len(durations)}
+
+
+def _sort_name(player):
+    """Sort key of a player, its name ignoring case. Players without a name sort first."""
+    return (player.name or u'').lower()
+
+
+class PlayerRegistry:
+    """An in-memory index of the CM's players by id, name and group, loaded with one list call.
+
+    Lookups and searches are local. The index is loaded on first use and again on refresh(), when older
+    than max_age seconds if given, or every interval seconds in the background after schedule().
+    Group membership is loaded the first time it is asked for: the groups with one listPlayerGroups call,
+    as scws.Resolver lists them, then the players of each group with a PlayerRS.list call searching on
+    group_column.
+    """
+    group_column = u'playerGroupId'     #PlayerRS.list search column selecting the players of a group
+
+    def __init__(self, content_manager, max_age=None, workers=scws._def_workers):
+        self.content_manager = content_manager
+        self.max_age = max_age
+        self.workers = workers
+        self.loaded = None      #time of the last load
+        self._index = None      #(by id, by name, sorted [(lowercase name, id)])
+        self._groups = None     #group name: list of player ids
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def refresh(self, players=None):
+        """Reloads the index, from the given list of PlayerTOs if already fetched."""
+        if players is None:
+            players = self.content_manager.PlayerRS.list()
+        by_id, by_name = {}, {}
+        for player in players:
+            by_id[player.id] = player
+            by_name.setdefault(player.name, player)
+        names = sorted((_sort_name(player), player.id) for player in players)
+        with self._lock:
+            self._index = (by_id, by_name, names)     #replaced whole, readers see one or the other
+            self._groups = None
+            self.loaded = time.time()
+
+    def schedule(self, interval):
+        """Refreshes the index every interval seconds in a background thread, until cancel()."""
+        with self._lock:
+            if self._timer: self._timer.cancel()
+            self._start(interval)
+
+    def _start(self, interval):
+        """Starts the timer of the next scheduled refresh. Called with the lock held."""
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                pass        #keep the last index, try again next time
+            with self._lock:
+                if self._timer is timer:    #not cancelled or rescheduled meanwhile
+                    self._start(interval)
+        timer = self._timer = threading.Timer(interval, run)
+        timer.daemon = True
+        timer.start()
+
+    def cancel(self):
+        """Stops scheduled refreshes."""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer: timer.cancel()
+
+    def _get_index(self):
+        if self._index is None or (self.max_age and time.time() - self.loaded > self.max_age):
+            self.refresh()
+        return self._index
+
+    def __len__(self):
+        return len(self._get_index()[0])
+
+    def __iter__(self):
+        return iter(sorted(self._get_index()[0].values(), key=_sort_name))
+
+    def get(self, player_id):
+        """Returns the PlayerTO with the given id, or None."""
+        return self._get_index()[0].get(player_id)
+
+    def find(self, name):
+        """Returns the PlayerTO with the given name, or None."""
+        return self._get_index()[1].get(name)
+
+    def names(self):
+        """Returns a dictionary of all players, of format { 'name' : 'id' }."""
+        return dict((name, player.id) for name, player in self._get_index()[1].items())
+
+    def search(self, text, prefix=False):
+        """Returns the players whose name contains text, or starts with it if prefix is given, ignoring case,
+        sorted by name."""
+        by_id, by_name, names = self._get_index()
+        text = text.lower()
+        if prefix:
+            start = bisect.bisect_left(names, (text,))
+            found = []
+            for name, id in names[start:]:
+                if not name.startswith(text): break
+                found.append(id)
+        else:
+            found = [id for name, id in names if text in name]
+        return [by_id[id] for id in found]
+
+    def groups(self):
+        """Returns a dictionary of { 'group name' : [player ids] }, loading group membership on first use."""
+        by_id = self._get_index()[0]
+        groups = self._groups
+        if groups is None:
+            player_groups = self.content_manager.PlayerRS.listPlayerGroups()
+            results = self.content_manager.map(u'PlayerRS.list',
+                [{u'searchCriteria' : scws.TObj(column=self.group_column, restriction=u'EQUALS', value=group.id)}
+                 for group in player_groups], workers=self.workers, raise_errors=True)
+            groups = {}
+            for group, players in zip(player_groups, results):
+                ids = groups.setdefault(group.name, [])
+                ids.extend(sorted(player.id for player in players if player.id in by_id and player.id not in ids))
+            with self._lock:
+                if self._index is not None and self._index[0] is by_id:
+                    self._groups = groups
+        return groups
+
+    def in_group(self, group):
+        """Returns the players in the named group, sorted by name."""
+        by_id = self._get_index()[0]
+        players = [by_id[id] for id in self.groups().get(group, []) if id in by_id]
+        return sorted(players, key=_sort_name)
+
+
 class ScalaMonitor:
-    def __init__(self, baseurl, authstr, api):
-        self.content_manager = scws.ConManager(baseurl, authstr, api_vers=api)
+    def __init__(self, baseurl, authstr, api, workers=scws._def_workers):
+        #workers caps the requests in flight, however many threads the fleet, media and playlist
+        #fetches start between them
+        self.content_manager = scws.ConManager(baseurl, authstr, api_vers=api, limit=workers)
+        self.workers = workers
+        self.registry = PlayerRegistry(self.content_manager, workers=workers)
+        self.player = None
+        self.previous = {}      # player id: get_player_info() output at the last poll_fleet()
+        self.changes = None     # what the last poll_fleet() found changed, see there
+        self.new_snapshot()
+
+    def new_snapshot(self):
+        """Forgets the channels, playlists, timeslots and media fetched so far, so they are fetched again."""
+        self.lookups = SnapshotCache()
+        self.expander = PlaylistExpander(self.content_manager, self.workers, self.lookups)
+        self.media_index = {}   # media id: MediaTO
+        self.indicators = None  # kind: { id : change indicator } when the snapshot was taken
+
+    def lookup(self, function, **kwargs):
+        """Calls a CM function, e.g. 'ChannelRS.getFrames', once per snapshot for the given arguments.
+        The result is shared by all players."""
+        service, name = function.split(u'.')
+        return self.lookups.get((function,) + tuple(sorted(kwargs.items())),
+            lambda: getattr(getattr(self.content_manager, service), name)(**kwargs))
 
     def get_players(self):
         """Returns a dictionary of all players, of format { 'name' : 'id' }. Note that id is a string,
         this is by design, all other functions requiring ID parameters in ScalaMonitor (and indeed, the scala API)
         accept strings.
         """
-        return dict((player.name, player.id)
-                    for player in self.content_manager.PlayerRS.list())
+        return self.registry.names()
 
     def set_player(self, player_id):
         """ Sets the player to be monitored by ScalaMonitor.
 
-        Searches through all players, will find the first player that matches the provided name,
-        and set the ScalaMonitor to that player.
+        Looks the id up in the player registry, and sets the ScalaMonitor to that player. Says which on
+        stderr, as stdout may be carrying JSON lines.
         """
-        players = self.content_manager.PlayerRS.list()
-        try:
-            self.player =  next(p for p in players if p.id == player_id)
-        except StopIteration as e:
-            #re-raise as a more relevant exception
-            self.player = None
+        self.player = self.registry.get(player_id)
+        if self.player is None:
             raise AttributeError(u'player ' + player_id + u' not found')
 
-        print u'Player set to ' + self.player.name
+        print >> sys.stderr, u'Player set to ' + self.player.name
 
 
     def get_player_info(self):
         """Returns a dictionary containing
 
-        {'frame_info : {<see get_frame_info()>},
+        {'displays' : [{'id' : '5', 'name' : 'disp', 'channel_id' : '1'}],
+        'channel' : {'id' : '1', 'name' : 'My Channel'},
+        'frame_info : {<see get_frame_info()>},
         'playlists' : [<see get_playlists()>],
         'id' : '123'
         'name' : 'scala_box'
         }
         """
-        output = {u'name' : self.player.name, u'id' : self.player.id}
+        self.new_snapshot()
+        return self.build_player_info(self.player)
+
+    def build_player_info(self, player):
+        """Returns get_player_info() output for the given PlayerTO, reusing what has been fetched
+        in this snapshot."""
+        output = {u'name' : player.name, u'id' : player.id}
 
-        displays = self.content_manager.PlayerRS.getPlayerDisplays(playerId=self.player.id)
+        displays = self.lookup(u'PlayerRS.getPlayerDisplays', playerId=player.id)
 
-        if not displays: raise ValueError(u'No displays found for player ' + self.player.name)
+        if not displays: raise ValueError(u'No displays found for player ' + player.name)
+
+        output[u'displays'] = [{u'id' : display.id, u'name' : display.name, u'channel_id' : display.channelId}
+                               for display in displays]
 
         #should only ever be one - but better safe than sorry
         for display in displays:
-            channels = self.content_manager.ChannelRS.get(channelId=display.channelId)
+            channels = self.lookup(u'ChannelRS.get', channelId=display.channelId)
             if not channels: raise ValueError(u'No channels found for display ' + display.name)
 
             for channel in channels:
+                output[u'channel'] = {u'id' : channel.id, u'name' : channel.name}
                 output[u'frame_info'] = self.get_frame_info(channel)
+                frames = self.lookup(u'ChannelRS.getFrames', channelId=channel.id)
+
+                #fetch every media item played on this channel once, rather than once per playlist it's in
+                media_ids = []
+                for frame in frames:
+                    for t in self.get_timeslots(channel.id, frame.id):
+                        if t.playlistId != None:
+                            media_ids.extend(self.get_media_ids(t.playlistId))
+                self.fetch_media(media_ids)
+
                 playlist_info = {}
-                for frame in self.content_manager.ChannelRS.getFrames(channelId=channel.id):
+                for frame in frames:
                     #get playlists associated with this frame and add them to dict
 
                     #we need to do this carefully. we want to make sure the frames list is extended.
@@ -88,10 +480,163 @@ class ScalaMonitor:
 
         return output
 
+    def snapshot_fleet(self, player_ids=None, workers=scws._def_workers):
+        """Builds get_player_info() output for every player, or those with the given ids, concurrently.
+
+        Yields (player id, output) tuples as each player finishes, output being the exception raised
+        if that player failed. Channels, frames, timeslots, playlists and media are fetched once for
+        the whole fleet.
+        """
+        players = self.content_manager.PlayerRS.list()
+        self.registry.refresh(players)
+        self.new_snapshot()
+        for result in self._build_fleet(players, player_ids, workers):
+            yield result
+
+    def poll_fleet(self, player_ids=None, workers=scws._def_workers):
+        """Incremental version of snapshot_fleet(), for polling.
+
+        The first call takes a full snapshot. Later calls keep it and compare the change indicators of
+        players, channels, playlists and media (their lastModified or revision, read with one list call
+        each), and the timeslots of every frame and the displays of every player with those seen before.
+        Only what changed is fetched again. Yields (player id, output, diff) tuples as each player finishes, diff being the list of
+        changes since the last poll from diff_info(). Players that disappeared yield (id, None, diff).
+
+        Afterwards, changes holds the ids of what was found changed:
+        {'player' : [...], 'channel' : [...], 'playlist' : [...], 'media' : [...], 'timeslots' : [...],
+         'displays' : [...]}
+        with channel ids listed under timeslots and player ids under displays, or None after a full snapshot.
+        """
+        players = self.content_manager.PlayerRS.list()
+        self.registry.refresh(players)
+        if self.indicators is None:
+            self.new_snapshot()
+            self.indicators = self._read_indicators(players)
+            self.changes = None
+        else:
+            self.changes = self._invalidate(self._read_indicators(players), workers)
+
+        seen = set()
+        for player_id, output in self._build_fleet(players, player_ids, workers):
+            seen.add(player_id)
+            if isinstance(output, Exception):
+                yield player_id, output, []
+                continue
+            diff = diff_info(self.previous.get(player_id), output)
+            self.previous[player_id] = output
+            yield player_id, output, diff
+
+        if player_ids is None:
+            for player_id in [id for id in self.previous if id not in seen]:
+                yield player_id, None, diff_info(self.previous.pop(player_id), None)
+
+    def _read_indicators(self, players):
+        """Returns the current change indicators, see poll_fleet().
+
+        The media list is paged through in full on every poll, as MediaRS.list can't be narrowed to
+        what changed since a time: with a large library this is the bulk of a poll's cost.
+        """
+        channels, playlists = self.content_manager.batch([(u'ChannelRS.list',), (u'PlaylistRS.list',)],
+                                                         raise_errors=True)
+        return {u'player' : change_indicators(players),
+                u'channel' : change_indicators(channels),
+                u'playlist' : change_indicators(playlists),
+                u'media' : change_indicators(self.content_manager.iter_list(u'MediaRS'))}
+
+    def _invalidate(self, indicators, workers):
+        """Forgets what changed since the indicators were last read, returns the changes, see poll_fleet()."""
+        changes = {}
+        for kind, new in indicators.items():
+            old = self.indicators[kind]
+            changes[kind] = sorted(id for id in set(old) | set(new)
+                                   if old.get(id) != new.get(id) or new.get(id) is None)
+        self.indicators = indicators
+
+        #a lookup that failed last time is tried again, rather than failing every poll from then on
+        self.lookups.discard_errors()
+        players, channels = set(changes[u'player']), set(changes[u'channel'])
+        playlists, media = set(changes[u'playlist']), set(changes[u'media'])
+        def stale(key):
+            if key[0] == u'items': return key[1] in playlists
+            if key[0] == u'timeslots': return key[1] in channels
+            args = dict(key[1:])
+            return (args.get(u'playerId') in players or args.get(u'channelId') in channels
+                    or args.get(u'playlistId') in playlists or args.get(u'mediaId') in media)
+        self.lookups.discard(stale)
+        for id in media:
+            self.media_index.pop(id, None)
+
+        #neither schedules nor a player's displays carry a modification time: assigning a display another
+        #channel leaves the player's lastModified alone. Compare the timeslots of each frame and the
+        #displays of each player with those fetched before
+        displays = (u'PlayerRS.getPlayerDisplays',)
+        cached = [(key, value) for key, value in self.lookups.items()
+                  if key[0] == u'timeslots' or key[:1] == displays]
+        def fetch(key):
+            if key[0] == u'timeslots':
+                return self.content_manager.ChannelRS.getTimeslots({u'channelId':key[1]}, frameId=key[2])
+            return self.content_manager.PlayerRS.getPlayerDisplays(**dict(key[1:]))
+        results = scws.map_concurrent(fetch, [key for key, value in cached], workers=workers)
+        changes[u'timeslots'], changes[u'displays'] = [], []
+        for (key, value), fresh in zip(cached, results):
+            if isinstance(fresh, Exception):
+                self.lookups.discard(lambda k: k == key)
+            elif [t.__get_dict__() for t in value] != [t.__get_dict__() for t in fresh]:
+                self.lookups.set(key, fresh)
+                if key[0] == u'timeslots': kind, id = u'timeslots', key[1]
+                else:                      kind, id = u'displays', dict(key[1:])[u'playerId']
+                if id not in changes[kind]:
+                    changes[kind].append(id)
+
+        if playlists or changes[u'timeslots']:
+            self.expander = PlaylistExpander(self.content_manager, self.workers, self.lookups)
+        return changes
+
+    def _build_fleet(self, players, player_ids, workers):
+        """Yields (player id, get_player_info() output or exception) for players as each finishes."""
+        if player_ids is not None:
+            by_id = dict((player.id, player) for player in players)
+            players = []
+            for player_id in player_ids:
+                if player_id in by_id:
+                    players.append(by_id[player_id])
+                else:
+                    yield player_id, AttributeError(u'player ' + player_id + u' not found')
+
+        todo = Queue.Queue()
+        for player in players:
+            todo.put(player)
+        done = Queue.Queue()
+
+        def worker():
+            while True:
+                try:
+                    player = todo.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    done.put((player.id, self.build_player_info(player)))
+                except Exception as e:
+                    done.put((player.id, e))
+
+        for i in range(min(workers, len(players))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        for i in range(len(players)):
+            while True:
+                try:
+                    yield done.get(timeout=0.5)     #stay responsive to Ctrl-C
+                    break
+                except Queue.Empty:
+                    pass
+
     def get_frame_info(self, channel):
         """Returns frame info for a channel. Returns a dictionary that looks like the following:
         {'frames': [
-            { 'name' : 'screen 1',
+            { 'id' : '12',
+              'name' : 'screen 1',
               'dimensions' : { 'width' : 1920, 'height': 1080},
               'top_left' : { 'x' : 0, 'y': 0},
               'z-index' : 0
@@ -106,19 +651,20 @@ class ScalaMonitor:
         the back, with each entry up to n heading towards the front.
 
         """
-        framesets = self.content_manager.ChannelRS.getFrameset(channelId=channel.id)
+        framesets = self.lookup(u'ChannelRS.getFrameset', channelId=channel.id)
 
         if not framesets: raise ValueError('No frameset found for channel ' + channel.name)
 
         frameset = {u'id' : framesets[0].id, u'name' : framesets[0].name}
-        frames = self.content_manager.ChannelRS.getFrames(channelId=channel.id)
+        frames = self.lookup(u'ChannelRS.getFrames', channelId=channel.id)
 
 
         #frame.audioTrack is 'true' if audio, no point logging this as it's automatically included anyway
         frame_info = []
         for frame in frames:
             if frame.audioTrack != 'true':
-                frame_info.append({u'name' : frame.name,
+                frame_info.append({u'id' : frame.id,
+                        u'name' : frame.name,
                         u'dimensions' : { u'width': int(frame.width), u'height' : int(frame.height)},
                         u'top_left' : {u'x' : int(frame.x), u'y' : int(frame.y)},
                         u'z-index' : int(frame.sortOrder)
@@ -129,22 +675,38 @@ class ScalaMonitor:
 
 
     def get_media_ids(self, playlistId):
-        """Returns a list of all media ids of media contained within a playlist and its sub-playlists
+        """Returns a list of all media ids of media contained within a playlist and its sub-playlists,
+        in play order. See PlaylistExpander.expand() for durations and other details.
         """
-        playlist_items = self.content_manager.PlaylistRS.getPlaylistItems(playlistId=playlistId)
-        if not playlist_items: raise ValueError(u'No playlist found with id ' + playlistId)
+        return [entry[u'media_id'] for entry in self.expander.expand(playlistId)]
 
-        out = []
-        for item in playlist_items:
-            if item.playlistItemType == u'SUB_PLAYLIST':
-                #playlist could be full of sub-playlists rather than media items, so recurse through
-                out.extend(self.get_media_ids(item.playlistId))
-            elif item.playlistItemType == u'MEDIA_ITEM' or item.playlistItemType == u'MESSAGE':
-                out.append(item.mediaId)
-            else:
-                raise ValueError(u'Playlist item ' + item.id + u' has unknown playlist type ' + item.playlistItemType)
+    def fetch_media(self, media_ids):
+        """Fetches the media objects of the given ids into media_index, each id once and concurrently.
+        Ids already in media_index are skipped.
+        """
+        missing = []
+        for id in media_ids:
+            if id not in self.media_index and id not in missing:
+                missing.append(id)
+
+        def fetch(id):
+            return self.lookup(u'MediaRS.get', mediaId=id)
+        results = scws.map_concurrent(fetch, missing, workers=self.workers)
+        for id, media in zip(missing, results):
+            if isinstance(media, Exception): raise media
+            if not media: raise ValueError(u'Media not found ' + id)
+            self.media_index[id] = media[0]
+
+    def get_timeslots(self, channelId, frameId):
+        """Returns the timeslots of a frame, fetched once per snapshot."""
+        #don't ask why channelId needs to be contained within a map - It just does
+        return self.lookups.get((u'timeslots', channelId, frameId),
+            lambda: self.content_manager.ChannelRS.getTimeslots({u'channelId':channelId}, frameId=frameId))
 
-        return out
+    def get_schedule(self, channelId, frameId, horizon=scala_schedule.def_horizon):
+        """Returns a scala_schedule.FrameSchedule of the timeslots of a frame, for finding what plays on it
+        when without asking the CM again."""
+        return scala_schedule.FrameSchedule(self.get_timeslots(channelId, frameId), horizon)
 
     def get_media_info(self, media):
         """Returns an info dict containing information on a provided MediaTO object
@@ -169,10 +731,12 @@ class ScalaMonitor:
     def get_playlist_info(self, channelId, frameId):
         """ Returns an info dict containing information on all playlists contained within this frame
         {'playlist 1' : {
+                'id' : '42',
                 'items' : {
                     'file 1' : {<see get_media_info()>}
                     'file 2' : {<see get_media_info()>}
-                }
+                },
+                'loop_length' : {<see PlaylistExpander.loop_length()>}
             }, ...
         }
 
@@ -181,43 +745,249 @@ class ScalaMonitor:
         """
         output = {}
 
-        #don't ask why channelId needs to be contained within a map - It just does
-        timeslots = self.content_manager.ChannelRS.getTimeslots({u'channelId':channelId}, frameId=frameId)
-        for t in timeslots:
+        for t in self.get_timeslots(channelId, frameId):
             if t.playlistId != None:
 
                 media_items = self.get_media_ids(t.playlistId)
-                #media_items is a list of media id
-
-                frames = []
+                #media_items is a list of media id, fetch any not seen yet in this snapshot
+                self.fetch_media(media_items)
 
                 items = {}
                 for id in media_items:
-                    media = self.content_manager.MediaRS.get(mediaId=id)
-                    if not media: raise ValueError(u'Media not found ' + mediaId)
-
-                    items[media[0].name] = self.get_media_info(media[0])
+                    media = self.media_index[id]
+                    items[media.name] = self.get_media_info(media)
 
-                playlists = self.content_manager.PlaylistRS.get(playlistId=t.playlistId)
-                if not playlists: raise ValueError(u'No playlist found with id ' + playlistId)
+                playlists = self.lookup(u'PlaylistRS.get', playlistId=t.playlistId)
+                if not playlists: raise ValueError(u'No playlist found with id ' + t.playlistId)
                 output[playlists[0].name] = {}
+                output[playlists[0].name][u'id'] = t.playlistId
                 output[playlists[0].name][u'items'] = items
+                output[playlists[0].name][u'loop_length'] = self.expander.loop_length(t.playlistId)
 
         return output
 
+def split_records(output, max_items=None):
+    """Returns a list of output records for one player's get_player_info() output: the output itself, or if
+    its playlists hold more than max_items media items, the output with the playlist names in place of the
+    playlists followed by one record per playlist
+    {'player' : '123', 'name' : 'playlist 1', <the rest of the playlist, see get_playlist_info()>}
+    """
+    playlists = output.get(u'playlists', {})
+    if max_items is None or sum(len(playlist[u'items']) for playlist in playlists.values()) <= max_items:
+        return [output]
+    head = dict(output)
+    head[u'playlists'] = sorted(playlists)
+    records = [head]
+    for name in head[u'playlists']:
+        record = {u'player' : output[u'id'], u'name' : name}
+        record.update(playlists[name])
+        records.append(record)
+    return records
+
+
+class NDJSONWriter:
+    """Writes records as newline delimited JSON, one line each, flushed as it is written so the output
+    can be followed while it grows.
+
+    Writes to stdout, or to the named file. When writing a record would take the file past max_bytes,
+    the file is first renamed to filename.1 (filename.1 to filename.2 and so on, up to backups) and a
+    new one started.
+    """
+    def __init__(self, filename=None, max_bytes=None, backups=5):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        if filename:
+            self._file = open(filename, u'ab')
+        else:
+            self._file = sys.stdout
+
+    def _rotate(self):
+        self._file.close()
+        names = [self.filename] + [u'%s.%d' % (self.filename, i) for i in range(1, self.backups + 1)]
+        for older, newer in reversed(zip(names[1:], names[:-1])):
+            if os.path.exists(newer):
+                if os.path.exists(older): os.remove(older)     #rename won't replace a file on windows
+                os.rename(newer, older)
+        self._file = open(self.filename, u'wb')
+
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            if self.filename and self.max_bytes and self._file.tell() and \
+                    self._file.tell() + len(line) > self.max_bytes:
+                self._rotate()
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        if self.filename: self._file.close()
+
+
+class PollScheduler:
+    """Polls each player of a ScalaMonitor on its own interval, for the life of the process.
+
+    A player starts at interval seconds. Each poll that finds it unchanged multiplies its interval by
+    backoff, up to max_interval, and a change drops it back to interval. Every due time is moved by up
+    to +/- jitter of the interval so players drift apart. Players due within the jitter of each other
+    are polled together with one poll_fleet() call, sharing its change indicator reads. New players
+    are picked up from the registry as they appear.
+    """
+
+    def __init__(self, monitor, interval=60, max_interval=None, backoff=2.0, jitter=0.1,
+                 workers=scws._def_workers):
+        self.monitor = monitor
+        self.interval = interval
+        self.max_interval = max_interval or interval * 16
+        self.backoff = backoff
+        self.jitter = jitter
+        self.workers = workers
+        self.intervals = {}     #player id: current interval
+        self._due = []          #heap of (due time, player id)
+
+    def _schedule(self, player_id, now):
+        interval = self.intervals[player_id]
+        heapq.heappush(self._due, (now + interval * random.uniform(1 - self.jitter, 1 + self.jitter),
+                                   player_id))
+
+    def _add_new(self, now):
+        for player in self.monitor.registry:
+            if player.id not in self.intervals:
+                self.intervals[player.id] = self.interval
+                heapq.heappush(self._due, (now + self.interval * random.uniform(0, self.jitter), player.id))
+
+    def next_due(self):
+        """Returns the time the next player is due, or None if there are none."""
+        return self._due[0][0] if self._due else None
+
+    def poll_due(self, now=None):
+        """Polls the players that are due and reschedules them. Returns a list of (player id, output, diff)
+        as from poll_fleet(), output being an exception if that player failed, or None if it was removed.
+        """
+        if now is None: now = time.time()
+        if not self.intervals:
+            self._add_new(now)
+        due = []
+        while self._due and self._due[0][0] <= now + self.interval * self.jitter:
+            due.append(heapq.heappop(self._due)[1])
+        if not due:
+            return []
+
+        try:
+            results = list(self.monitor.poll_fleet(due, workers=self.workers))
+        except Exception:
+            for player_id in due:       #could not poll at all, try these again after the shortest interval
+                heapq.heappush(self._due, (now + self.interval, player_id))
+            raise
+
+        now = time.time()
+        polled = []
+        for player_id, output, diff in results:
+            if isinstance(output, Exception) and self.monitor.registry.get(player_id) is None:
+                #gone from the CM, report it once and stop polling it
+                output, diff = None, diff_info(self.monitor.previous.pop(player_id, None), None)
+                del self.intervals[player_id]
+            else:
+                if diff:
+                    self.intervals[player_id] = self.interval
+                elif not isinstance(output, Exception):
+                    self.intervals[player_id] = min(self.intervals[player_id] * self.backoff,
+                                                    self.max_interval)
+                self._schedule(player_id, now)
+            polled.append((player_id, output, diff))
+        self._add_new(now)
+        return polled
+
+    def run(self, callback, stop=None):
+        """Polls forever, or until the stop event is set, calling callback(player id, output, diff) for
+        each player polled. Errors reaching the CM are passed to callback with a player id of None.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                results = self.poll_due()
+            except Exception as e:
+                results = [(None, e, [])]
+            for result in results:
+                callback(*result)
+            wait = self.next_due()
+            wait = self.interval if wait is None else wait - time.time()
+            if wait > 0:
+                stop.wait(wait)
+
+
 def main():
+    parser = OptionParser(usage=u'%prog [options]')
+    parser.add_option(u'-p', u'--player', default=u'Ski Kino 01',
+        help=u'Name of the player to snapshot, when not a daemon (default: %default)')
+    parser.add_option(u'-f', u'--fleet', action=u'store_true', default=False,
+        help=u'Snapshot every player, writing a JSON line for each as it is ready')
+    parser.add_option(u'-D', u'--daemon', action=u'store_true', default=False,
+        help=u'Keep polling every player, printing a JSON line for each change')
+    parser.add_option(u'-i', u'--interval', type=u'float', default=60,
+        help=u'Seconds between polls of a player after a change (default: %default)')
+    parser.add_option(u'-x', u'--max-interval', type=u'float',
+        help=u'Longest seconds between polls of an unchanged player (default: 16 intervals)')
+    parser.add_option(u'-j', u'--jitter', type=u'float', default=0.1,
+        help=u'Fraction of the interval to randomly move polls by (default: %default)')
+    parser.add_option(u'-w', u'--workers', type=u'int', default=scws._def_workers,
+        help=u'Concurrent requests to the CM (default: %default)')
+    parser.add_option(u'-s', u'--store', metavar=u'FILE',
+        help=u'Also record results in this SQLite file, for scala_store.py to query')
+    parser.add_option(u'-o', u'--output', metavar=u'FILE',
+        help=u'Append JSON lines to this file instead of writing to stdout')
+    parser.add_option(u'-r', u'--rotate', type=u'float', metavar=u'MB',
+        help=u'Start a new output file when it reaches this size, keeping 5 old ones')
+    parser.add_option(u'-l', u'--split', type=u'int', metavar=u'ITEMS',
+        help=u'Write players with more media items than this as one line per playlist')
+    opts, args = parser.parse_args()
+    out = NDJSONWriter(opts.output, opts.rotate and int(opts.rotate * 1048576))
+    store = None
+    if opts.store:
+        import scala_store
+        store = scala_store.SnapshotStore(opts.store)
+
     #read config file
     try:
         config = json.load(open(os.path.join(os.path.dirname(__file__), u'settings.json'), u'r'))
     except IOError:
         raise IOError(u'The settings.json file does not exist')
 
-    scala = ScalaMonitor(config[u"baseurl"], config[u"authstring"], config[u"api"])
-    players = scala.get_players()
-    scala.set_player(players[u'Ski Kino 01'])
-
-    s = scala.get_player_info()
-    print json.dumps(s)
+    scala = ScalaMonitor(config[u"baseurl"], config[u"authstring"], config[u"api"], workers=opts.workers)
+    if opts.fleet:
+        for player_id, s in scala.snapshot_fleet(workers=opts.workers):
+            if isinstance(s, Exception):
+                print >> sys.stderr, u'%s: %s' % (player_id, s)
+                continue
+            if store: store.record(s)
+            for record in split_records(s, opts.split):
+                out.write(record)
+        return
+
+    if not opts.daemon:
+        players = scala.get_players()
+        scala.set_player(players[opts.player])
+
+        s = scala.get_player_info()
+        if store: store.record(s)
+        for record in split_records(s, opts.split):
+            out.write(record)
+        return
+
+    def report(player_id, output, diff):
+        if isinstance(output, Exception):
+            print >> sys.stderr, u'%s: %s' % (player_id or u'poll', output)
+        elif diff:
+            if store:
+                if output is None: store.record_removed(player_id)
+                else: store.record(output)
+            out.write({u'time' : time.time(), u'player' : player_id, u'diff' : diff})
+    scheduler = PollScheduler(scala, opts.interval, opts.max_interval, jitter=opts.jitter, workers=opts.workers)
+    try:
+        scheduler.run(report)
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
     main();
@@ -0,0 +1,356 @@
+"""
+Expands the timeslots of a frame into the times they play, to answer what plays on a frame at a time or
+within a range, and which timeslots overlap, without asking the Content Manager again.
+
+A timeslot plays from its startTime to its endTime on the days its recurrence selects between its startDate
+and endDate, inclusive:
+
+    DAILY       every day
+    WEEKLY      the days named in weekdays, or the weekday of startDate if none
+    MONTHLY     every monthPeriod months from startDate, on day recurrenceDayOfMonth, or on the
+                recurrenceWeekOfMonth (FIRST ... FOURTH or LAST) recurrenceDayOfWeek
+    NONE        once, from startTime on startDate to endTime on endDate (or startDate)
+
+An endTime at or before the startTime ends on the next day, and an endTime of 23:59:59 at midnight, so that
+back to back days leave no gap. Times are the player's local time, as datetime objects without a timezone.
+
+Command line usage:
+    scala_schedule.py [options] <channel id or name> <frame id or name>
+
+    Prints what plays on the frame now, at a time given with --at, between --start and --end, or the
+    overlapping timeslots with --overlaps, as JSON lines.
+"""
+import datetime
+import json
+import os
+import sys
+from optparse import OptionParser
+
+def_horizon = 366       #days materialized past today
+def_history = 31        #days materialized before today
+
+weekdays = [u'MONDAY', u'TUESDAY', u'WEDNESDAY', u'THURSDAY', u'FRIDAY', u'SATURDAY', u'SUNDAY']
+weeks_of_month = {u'FIRST' : 0, u'SECOND' : 1, u'THIRD' : 2, u'FOURTH' : 3, u'LAST' : -1}
+
+
+def parse_date(value):
+    """Takes a date as 'YYYY-MM-DD', possibly followed by a time as the CM gives it, and returns a date,
+    or None if there's no date."""
+    if not value:
+        return None
+    return datetime.datetime.strptime(value[:10], u'%Y-%m-%d').date()
+
+
+def parse_time(value, default):
+    """Takes a time as 'HH:MM[:SS]' and returns a timedelta since midnight, or default if there's no time."""
+    if not value:
+        return default
+    parts = [int(part) for part in value.split(u'.')[0].split(u':')]
+    return datetime.timedelta(hours=parts[0], minutes=parts[1], seconds=parts[2] if len(parts) > 2 else 0)
+
+
+def parse_when(value):
+    """Takes 'YYYY-MM-DD[ HH:MM[:SS]]' and returns a datetime."""
+    for format in (u'%Y-%m-%d %H:%M:%S', u'%Y-%m-%d %H:%M', u'%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, format)
+        except ValueError:
+            pass
+    raise ValueError(u'not a date: ' + value)
+
+
+def _field(timeslot, name):
+    """Returns a field of a TimeslotTO or a dictionary of one."""
+    if isinstance(timeslot, dict):
+        return timeslot.get(name)
+    return getattr(timeslot, name)
+
+
+def _repeated(timeslot, name):
+    """Returns all values of a repeated field. The SOAP decoder keeps the first as name and those after
+    it as name.1, name.2 ... (zero padded, and numbered across all repeated fields of the object);
+    a dictionary may also give a list."""
+    fields = timeslot if isinstance(timeslot, dict) else timeslot.__get_dict__()
+    keys = []
+    for key in fields:
+        if key == name:
+            keys.append((-1, key))
+        elif key.startswith(name + u'.') and key[len(name) + 1:].isdigit():
+            keys.append((int(key[len(name) + 1:]), key))
+    out = []
+    for number, key in sorted(keys):
+        value = fields[key]
+        if isinstance(value, (list, tuple)):
+            out.extend(value)
+        elif value is not None:
+            out.append(value)
+    return out
+
+
+def _month_day(year, month, week, weekday):
+    """Returns the day of the month of the week'th (0 based, -1 for last) weekday (0 is Monday), or None."""
+    first = datetime.date(year, month, 1)
+    days = [first + datetime.timedelta(days=d) for d in range(31)]
+    days = [day for day in days if day.month == month and day.weekday() == weekday]
+    if week >= len(days):
+        return None
+    return days[week].day
+
+
+def recurrence_days(timeslot, first, last):
+    """Returns the dates from first to last, inclusive, on which a timeslot starts playing, see the module
+    documentation. first and last are clipped to the timeslot's start and end dates."""
+    start, end = parse_date(_field(timeslot, u'startDate')), parse_date(_field(timeslot, u'endDate'))
+    if start is None:
+        start = first
+    pattern = (_field(timeslot, u'recurrencePattern') or u'NONE').upper()
+    if pattern not in (u'DAILY', u'WEEKLY', u'MONTHLY'):
+        return [start] if first <= start <= last else []
+    if end is not None:
+        last = min(last, end)
+    first = max(first, start)
+    if first > last:
+        return []
+
+    days = [first + datetime.timedelta(days=d) for d in range((last - first).days + 1)]
+    if pattern == u'WEEKLY':
+        selected = set(weekdays.index(day.upper()) for day in _repeated(timeslot, u'weekdays')
+                       if day.upper() in weekdays) or set([start.weekday()])
+        return [day for day in days if day.weekday() in selected]
+    if pattern == u'MONTHLY':
+        period = int(_field(timeslot, u'monthPeriod') or 1)
+        day_of_month = _field(timeslot, u'recurrenceDayOfMonth')
+        week = weeks_of_month.get((_field(timeslot, u'recurrenceWeekOfMonth') or u'').upper())
+        day_of_week = (_field(timeslot, u'recurrenceDayOfWeek') or u'').upper()
+        out = []
+        for day in days:
+            if ((day.year - start.year) * 12 + day.month - start.month) % period:
+                continue
+            if week is not None and day_of_week in weekdays:
+                if day.day == _month_day(day.year, day.month, week, weekdays.index(day_of_week)):
+                    out.append(day)
+            elif day.day == int(day_of_month or start.day):
+                out.append(day)
+        return out
+    return days
+
+
+def occurrences(timeslot, first, last):
+    """Returns the (start, end) datetimes a timeslot plays, for those starting on the dates from first to
+    last inclusive."""
+    begin = parse_time(_field(timeslot, u'startTime'), datetime.timedelta(0))
+    finish = parse_time(_field(timeslot, u'endTime'), datetime.timedelta(days=1))
+    if finish == datetime.timedelta(hours=23, minutes=59, seconds=59):
+        finish = datetime.timedelta(days=1)
+
+    pattern = (_field(timeslot, u'recurrencePattern') or u'NONE').upper()
+    if pattern not in (u'DAILY', u'WEEKLY', u'MONTHLY'):
+        out = []
+        for day in recurrence_days(timeslot, first, last):
+            end_day = parse_date(_field(timeslot, u'endDate')) or day
+            start = datetime.datetime.combine(day, datetime.time()) + begin
+            end = datetime.datetime.combine(max(day, end_day), datetime.time()) + finish
+            if end <= start: end += datetime.timedelta(days=1)
+            out.append((start, end))
+        return out
+
+    if finish <= begin:
+        finish += datetime.timedelta(days=1)
+    return [(datetime.datetime.combine(day, datetime.time()) + begin,
+             datetime.datetime.combine(day, datetime.time()) + finish)
+            for day in recurrence_days(timeslot, first, last)]
+
+
+class IntervalIndex:
+    """A static interval tree over (start, end, value) tuples, half open. The intervals are kept sorted by
+    start as an implicit balanced tree, each node knowing the latest end below it, so a query visits
+    O(log n + k) nodes for k results."""
+
+    def __init__(self, intervals):
+        self.intervals = sorted(intervals)
+        self.starts = [interval[0] for interval in self.intervals]
+        self._max_end = [None] * len(self.intervals)
+        self._build(0, len(self.intervals))
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        ends = [self.intervals[mid][1], self._build(lo, mid), self._build(mid + 1, hi)]
+        self._max_end[mid] = max(end for end in ends if end is not None)
+        return self._max_end[mid]
+
+    def overlapping(self, start, end):
+        """Returns the intervals overlapping [start, end), in order of start."""
+        out = []
+        todo = [(0, len(self.intervals))]
+        while todo:
+            lo, hi = todo.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self._max_end[mid] <= start:
+                continue                                #everything below ends too early
+            todo.append((lo, mid))
+            if self.starts[mid] < end:                  #else neither this nor those after start in time
+                if self.intervals[mid][1] > start:
+                    out.append(self.intervals[mid])
+                todo.append((mid + 1, hi))
+        out.sort()
+        return out
+
+    def at(self, point):
+        """Returns the intervals containing point."""
+        return self.overlapping(point, point + datetime.timedelta(microseconds=1))
+
+
+class FrameSchedule:
+    """The times the timeslots of one frame play, from TimeslotTOs (or dictionaries of their fields) as
+    returned by ChannelRS.getTimeslots().
+
+    Occurrences are materialized from history days before today up to horizon days past it, and further
+    either way when a query asks for other times; timeslots that play once are always included, as they
+    cost one occurrence each. overlaps() without start and end looks at what has been materialized.
+    Queries return lists of
+    {'start' : datetime, 'end' : datetime, 'timeslot_id' : '12', 'playlist_id' : '34', 'name' : 'slot name'}
+    in order of start.
+    """
+
+    def __init__(self, timeslots, horizon=def_horizon, today=None, history=def_history):
+        self.timeslots = list(timeslots)
+        self.today = today = today or datetime.date.today()
+        self.since = self.until = None
+        self.index = None
+        self._materialize(today - datetime.timedelta(days=history), today + datetime.timedelta(days=horizon))
+
+    def _materialize(self, since, until):
+        """Expands the occurrences of every timeslot starting from the date since to until, inclusive."""
+        intervals = []
+        for i, timeslot in enumerate(self.timeslots):
+            first, last = since, until
+            if (_field(timeslot, u'recurrencePattern') or u'NONE').upper() not in (u'DAILY', u'WEEKLY', u'MONTHLY'):
+                first = last = parse_date(_field(timeslot, u'startDate')) or self.today
+            for start, end in occurrences(timeslot, first, last):
+                intervals.append((start, end, i))
+        self.since, self.until = since, until
+        self.index = IntervalIndex(intervals)
+
+    def _covers(self, start, end):
+        """Materializes further if start or end is outside what has been, by at least the original history
+        or horizon. A repeating occurrence ends within two days of its start date, so those starting the day
+        before start are needed too."""
+        since, until = self.since, self.until
+        if start is not None and start.date() - datetime.timedelta(days=1) < since:
+            since = min(start.date() - datetime.timedelta(days=1), since - datetime.timedelta(days=def_history))
+        if end is not None and end.date() > until:
+            until = max(end.date(), until + datetime.timedelta(days=def_horizon))
+        if (since, until) != (self.since, self.until):
+            self._materialize(since, until)
+
+    def _records(self, intervals):
+        out = []
+        for start, end, i in intervals:
+            timeslot = self.timeslots[i]
+            out.append({u'start' : start, u'end' : end, u'timeslot_id' : _field(timeslot, u'id'),
+                        u'playlist_id' : _field(timeslot, u'playlistId'), u'name' : _field(timeslot, u'name')})
+        return out
+
+    def at(self, when):
+        """Returns the occurrences playing at a datetime."""
+        self._covers(when, when)
+        return self._records(self.index.at(when))
+
+    def between(self, start, end):
+        """Returns the occurrences playing at any time from start to end."""
+        self._covers(start, end)
+        return self._records(self.index.overlapping(start, end))
+
+    def overlaps(self, start=None, end=None):
+        """Returns the pairs of timeslots that play at the same time, from start to end if given, as
+        {'timeslots' : [id, id], 'playlists' : [id, id],
+         'count' : the number of times they overlap,
+         'first' : (start, end) of the first overlap, 'last' : (start, end) of the last
+        }
+        """
+        self._covers(start, end)
+        intervals = self.index.intervals if start is None and end is None else \
+            self.index.overlapping(start or datetime.datetime.min, end or datetime.datetime.max)
+        pairs = {}
+        active = []     #(end, timeslot index) of occurrences that started and haven't ended
+        for start_, end_, i in intervals:
+            active = [(e, j) for e, j in active if e > start_]
+            for e, j in active:
+                if j == i:
+                    continue
+                window = (start_, min(e, end_))
+                key = (min(i, j), max(i, j))
+                if key in pairs:
+                    pairs[key][u'count'] += 1
+                    pairs[key][u'last'] = window
+                else:
+                    pairs[key] = {u'count' : 1, u'first' : window, u'last' : window}
+            active.append((end_, i))
+
+        out = []
+        for (i, j), found in sorted(pairs.items(), key=lambda item: item[1][u'first']):
+            found[u'timeslots'] = [_field(self.timeslots[i], u'id'), _field(self.timeslots[j], u'id')]
+            found[u'playlists'] = [_field(self.timeslots[i], u'playlistId'), _field(self.timeslots[j], u'playlistId')]
+            out.append(found)
+        return out
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(u'%Y-%m-%d %H:%M:%S')
+    raise TypeError(repr(value))
+
+
+def main():
+    import scala_monitor
+    parser = OptionParser(usage=__doc__)
+    parser.add_option(u'-a', u'--at', metavar=u'WHEN', help=u'Show what plays at this time (default: now)')
+    parser.add_option(u'-s', u'--start', metavar=u'WHEN', help=u'Show what plays from this time, to --end')
+    parser.add_option(u'-e', u'--end', metavar=u'WHEN', help=u'Show what plays up to this time')
+    parser.add_option(u'-o', u'--overlaps', action=u'store_true', default=False,
+        help=u'Show the timeslots that overlap, from --start to --end if given')
+    opts, args = parser.parse_args()
+    if len(args) != 2:
+        parser.error(u'give a channel and a frame')
+    try:
+        at, start, end = [opts.at and parse_when(opts.at), opts.start and parse_when(opts.start),
+                          opts.end and parse_when(opts.end)]
+    except ValueError as e:
+        parser.error(unicode(e))
+    if not opts.overlaps and bool(start) != bool(end):
+        parser.error(u'give both --start and --end')
+
+    #read config file
+    try:
+        config = json.load(open(os.path.join(os.path.dirname(__file__), u'settings.json'), u'r'))
+    except IOError:
+        raise IOError(u'The settings.json file does not exist')
+
+    scala = scala_monitor.ScalaMonitor(config[u"baseurl"], config[u"authstring"], config[u"api"])
+    encoding = sys.getfilesystemencoding() or u'utf-8'
+    channel, frame = args[0].decode(encoding), args[1].decode(encoding)
+    channel = scala.content_manager.resolve(u'channel', channel) or channel
+    for found in scala.content_manager.ChannelRS.getFrames(channelId=channel):
+        if frame in (found.id, found.name):
+            frame = found.id
+            break
+    schedule = scala.get_schedule(channel, frame)
+
+    if opts.overlaps:
+        rows = schedule.overlaps(start, end)
+    elif start:
+        rows = schedule.between(start, end)
+    else:
+        rows = schedule.at(at or datetime.datetime.now())
+    for row in rows:
+        print json.dumps(row, default=_json_default)
+
+if __name__ == '__main__':
+    main();
@@ -0,0 +1,316 @@
+"""
+Keeps ScalaMonitor output in a local SQLite file, to answer questions about players and their content
+without asking the Content Manager.
+
+Each player, display, channel, frame, playlist and media item is stored once, with its latest attributes.
+What shows on what is stored as facts with the time they were first and last true, so a snapshot that
+matches the previous one adds nothing:
+
+    player -> channel           player_channel
+    channel -> frame            frames.channel_id
+    frame -> playlist           frame_playlist
+    playlist -> media           playlist_media, sub-playlists expanded
+
+Command line usage:
+    scala_store.py [-s FILE] [--since WHEN] [--until WHEN] <query> [argument]
+
+    queries:
+        players-showing MEDIA       players that showed a media item, by id or name
+        content PLAYER              media and playlists of a player, by id or name
+        playlist-players PLAYLIST   players a playlist showed on, by id or name
+        history PLAYER              what was added to and removed from a player, and when
+        players                     every player with when it was last recorded
+
+WHEN is a date as 'YYYY-MM-DD[ HH:MM[:SS]]' in local time, or a duration ago such as 30m, 6h or 2d.
+"""
+import json
+import re
+import sqlite3
+import sys
+import time
+from optparse import OptionParser
+
+def_filename = u'snapshots.db'
+
+schema = u'''
+create table if not exists players (id text primary key, name text, seen real);
+create table if not exists displays (id text primary key, name text, player_id text);
+create table if not exists channels (id text primary key, name text, frameset_id text, frameset_name text);
+create table if not exists frames (id text primary key, channel_id text, name text,
+    x integer, y integer, width integer, height integer, z integer);
+create table if not exists playlists (id text primary key, name text,
+    seconds real, items integer, unknown integer);
+create table if not exists media (id text primary key, name text, path text, type text, filesize text);
+
+create table if not exists player_channel (player_id text, channel_id text, since real, until real);
+create table if not exists frame_playlist (frame_id text, playlist_id text, since real, until real);
+create table if not exists playlist_media (playlist_id text, media_id text, since real, until real);
+
+create index if not exists player_channel_player on player_channel (player_id, until);
+create index if not exists player_channel_channel on player_channel (channel_id);
+create index if not exists frame_playlist_frame on frame_playlist (frame_id, until);
+create index if not exists frame_playlist_playlist on frame_playlist (playlist_id);
+create index if not exists playlist_media_playlist on playlist_media (playlist_id, until);
+create index if not exists playlist_media_media on playlist_media (media_id);
+create index if not exists frames_channel on frames (channel_id);
+create index if not exists players_name on players (name);
+create index if not exists playlists_name on playlists (name);
+create index if not exists media_name on media (name);
+'''
+
+#(table, owner column, member column) of each kind of fact
+facts = {u'player_channel' : (u'player_id', u'channel_id'),
+         u'frame_playlist' : (u'frame_id', u'playlist_id'),
+         u'playlist_media' : (u'playlist_id', u'media_id')}
+
+
+def parse_when(value, now=None):
+    """Takes a time as 'YYYY-MM-DD[ HH:MM[:SS]]' in local time, or a duration ago such as '90s', '30m',
+    '6h' or '2d', and returns seconds since the epoch. Returns None if there's no time.
+    """
+    if not value:
+        return None
+    match = re.match(r'^(\d+(?:\.\d*)?)([smhd])$', value)
+    if match:
+        seconds = float(match.group(1)) * {u's' : 1, u'm' : 60, u'h' : 3600, u'd' : 86400}[match.group(2)]
+        return (now or time.time()) - seconds
+    for format in (u'%Y-%m-%d %H:%M:%S', u'%Y-%m-%d %H:%M', u'%Y-%m-%d'):
+        try:
+            return time.mktime(time.strptime(value, format))
+        except ValueError:
+            pass
+    raise ValueError(u'not a date or duration: ' + value)
+
+
+def _overlap(since, until, *aliases):
+    """Returns SQL and arguments requiring the facts of the given table aliases to have been true at the
+    same time, within since and until if given."""
+    clauses, args = [], []
+    for i, a in enumerate(aliases):
+        if since is not None:
+            clauses.append(u'(%s.until is null or %s.until >= ?)' % (a, a))
+            args.append(since)
+        if until is not None:
+            clauses.append(u'%s.since <= ?' % a)
+            args.append(until)
+        for b in aliases[i + 1:]:
+            clauses.append(u'(%s.until is null or %s.until >= %s.since)' % (a, a, b))
+            clauses.append(u'(%s.until is null or %s.until >= %s.since)' % (b, b, a))
+    return u' and '.join(clauses) or u'1', args
+
+
+class SnapshotStore:
+    """A SQLite file of ScalaMonitor output, see the module documentation.
+
+    record() takes get_player_info() output, as from snapshot_fleet() or poll_fleet(), and
+    record_removed() a player that is gone. The query methods return lists of dictionaries.
+    """
+
+    def __init__(self, filename=def_filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    def _upsert(self, table, rows):
+        if rows:
+            self.db.executemany(u'insert or replace into %s values (%s)' % (table, u','.join(u'?' * len(rows[0]))),
+                                rows)
+
+    def _set_facts(self, table, owner, members, now):
+        """Makes the facts of table for owner the given members, as of now: closes those no longer true,
+        opens those newly true, leaves the rest."""
+        owner_col, member_col = facts[table]
+        current = set(row[0] for row in self.db.execute(
+            u'select %s from %s where %s = ? and until is null' % (member_col, table, owner_col), (owner,)))
+        members = set(members)
+        self.db.executemany(u'update %s set until = ? where %s = ? and %s = ? and until is null'
+                            % (table, owner_col, member_col),
+                            [(now, owner, member) for member in current - members])
+        self.db.executemany(u'insert into %s values (?, ?, ?, null)' % table,
+                            [(owner, member, now) for member in members - current])
+
+    def record(self, output, now=None):
+        """Stores one player's get_player_info() output, as seen at now (default: the current time)."""
+        now = now or time.time()
+        player_id = output[u'id']
+        with self.db:
+            self._upsert(u'players', [(player_id, output[u'name'], now)])
+            self._upsert(u'displays', [(d[u'id'], d[u'name'], player_id) for d in output.get(u'displays', [])])
+
+            channel = output.get(u'channel')
+            frameset = output.get(u'frame_info', {})
+            if channel is None:
+                self._set_facts(u'player_channel', player_id, [], now)
+                return
+            self._upsert(u'channels', [(channel[u'id'], channel[u'name'], frameset.get(u'id'), frameset.get(u'name'))])
+            self._set_facts(u'player_channel', player_id, [channel[u'id']], now)
+            self._upsert(u'frames', [(f[u'id'], channel[u'id'], f[u'name'], f[u'top_left'][u'x'], f[u'top_left'][u'y'],
+                                      f[u'dimensions'][u'width'], f[u'dimensions'][u'height'], f[u'z-index'])
+                                     for f in frameset.get(u'frames', [])])
+
+            by_frame = dict((f[u'id'], []) for f in frameset.get(u'frames', []))
+            for name, playlist in output.get(u'playlists', {}).items():
+                loop = playlist.get(u'loop_length', {})
+                self._upsert(u'playlists', [(playlist[u'id'], name, loop.get(u'seconds'), loop.get(u'items'),
+                                             loop.get(u'unknown'))])
+                self._upsert(u'media', [(m[u'id'], media_name, m[u'path'], m[u'type'], m.get(u'filesize'))
+                                        for media_name, m in playlist[u'items'].items()])
+                self._set_facts(u'playlist_media', playlist[u'id'], [m[u'id'] for m in playlist[u'items'].values()], now)
+                for frame_id in playlist.get(u'frames', []):
+                    by_frame.setdefault(frame_id, []).append(playlist[u'id'])
+            #frames removed from the channel show nothing from now on
+            for row in self.db.execute(u'''select distinct fp.frame_id from frame_playlist fp
+                    join frames f on f.id = fp.frame_id where f.channel_id = ? and fp.until is null''',
+                    (channel[u'id'],)):
+                by_frame.setdefault(row[0], [])
+            #frames left out of frame_info, such as audio frames, are still needed to reach their channel
+            self.db.executemany(u'insert or ignore into frames (id, channel_id) values (?, ?)',
+                                [(frame_id, channel[u'id']) for frame_id in by_frame])
+            for frame_id, playlist_ids in by_frame.items():
+                self._set_facts(u'frame_playlist', frame_id, playlist_ids, now)
+
+    def record_removed(self, player_id, now=None):
+        """Records that a player no longer exists, as of now."""
+        with self.db:
+            self._set_facts(u'player_channel', player_id, [], now or time.time())
+
+    def _ids(self, table, value):
+        """Returns the ids of table whose id or name is value."""
+        return [row[0] for row in self.db.execute(u'select id from %s where id = ? or name = ?' % table,
+                                                  (value, value))]
+
+    def _query(self, sql, args):
+        return [dict(zip(row.keys(), row)) for row in self.db.execute(sql, args)]
+
+    def players_showing(self, media, since=None, until=None):
+        """Returns the players that showed a media item, given by id or name, between since and until
+        (default: ever), with the playlist it was in and from when to when (until None if still showing).
+        """
+        ids = self._ids(u'media', media)
+        overlap, args = _overlap(since, until, u'pc', u'fp', u'pm')
+        return self._query(u'''select distinct p.id, p.name, l.name as playlist,
+                max(pc.since, fp.since, pm.since) as since,
+                nullif(min(coalesce(pc.until, 1e100), coalesce(fp.until, 1e100), coalesce(pm.until, 1e100)), 1e100)
+                    as until
+            from playlist_media pm
+            join frame_playlist fp on fp.playlist_id = pm.playlist_id
+            join frames f on f.id = fp.frame_id
+            join player_channel pc on pc.channel_id = f.channel_id
+            join players p on p.id = pc.player_id
+            join playlists l on l.id = pm.playlist_id
+            where pm.media_id in (%s) and %s
+            order by p.name, since''' % (u','.join(u'?' * len(ids)), overlap), ids + args)
+
+    def content(self, player, at=None):
+        """Returns the media a player, given by id or name, showed at a time (default: now), with the
+        playlist and frame it was in."""
+        ids = self._ids(u'players', player)
+        overlap, args = _overlap(at, at, u'pc', u'fp', u'pm')
+        if at is None:
+            overlap, args = u'pc.until is null and fp.until is null and pm.until is null', []
+        return self._query(u'''select distinct f.name as frame, l.name as playlist, m.id, m.name, m.path, m.type,
+                m.filesize
+            from player_channel pc
+            join frames f on f.channel_id = pc.channel_id
+            join frame_playlist fp on fp.frame_id = f.id
+            join playlist_media pm on pm.playlist_id = fp.playlist_id
+            join playlists l on l.id = pm.playlist_id
+            join media m on m.id = pm.media_id
+            where pc.player_id in (%s) and %s
+            order by f.z, l.name, m.name''' % (u','.join(u'?' * len(ids)), overlap), ids + args)
+
+    def playlist_players(self, playlist, since=None, until=None):
+        """Returns the players a playlist, given by id or name, showed on between since and until
+        (default: ever), with the frame and from when to when."""
+        ids = self._ids(u'playlists', playlist)
+        overlap, args = _overlap(since, until, u'pc', u'fp')
+        return self._query(u'''select distinct p.id, p.name, f.name as frame,
+                max(pc.since, fp.since) as since,
+                nullif(min(coalesce(pc.until, 1e100), coalesce(fp.until, 1e100)), 1e100) as until
+            from frame_playlist fp
+            join frames f on f.id = fp.frame_id
+            join player_channel pc on pc.channel_id = f.channel_id
+            join players p on p.id = pc.player_id
+            where fp.playlist_id in (%s) and %s
+            order by p.name, since''' % (u','.join(u'?' * len(ids)), overlap), ids + args)
+
+    def history(self, player, since=None, until=None):
+        """Returns what was added to and removed from a player, given by id or name, between since and
+        until, in time order: {'time', 'change' : 'added'/'removed', 'kind', 'id', 'name'}, kind being
+        channel, playlist or media. Changes to a channel or playlist are listed once, not per player."""
+        ids = self._ids(u'players', player)
+        marks = u','.join(u'?' * len(ids))
+        rows = self._query(u'''
+            select 'channel' as kind, pc.channel_id as id, c.name, pc.since, pc.until, pc.since as s, pc.until as u
+                from player_channel pc join channels c on c.id = pc.channel_id
+                where pc.player_id in (%s)
+            union select 'playlist', fp.playlist_id, l.name, fp.since, fp.until, pc.since, pc.until
+                from player_channel pc join frames f on f.channel_id = pc.channel_id
+                join frame_playlist fp on fp.frame_id = f.id join playlists l on l.id = fp.playlist_id
+                where pc.player_id in (%s)
+            union select 'media', pm.media_id, m.name, pm.since, pm.until, max(pc.since, fp.since),
+                    nullif(min(coalesce(pc.until, 1e100), coalesce(fp.until, 1e100)), 1e100)
+                from player_channel pc join frames f on f.channel_id = pc.channel_id
+                join frame_playlist fp on fp.frame_id = f.id
+                join playlist_media pm on pm.playlist_id = fp.playlist_id join media m on m.id = pm.media_id
+                where pc.player_id in (%s)''' % (marks, marks, marks), ids * 3)
+
+        changes = {}
+        for row in rows:
+            #clip each fact to when it was on this player
+            start = max(row[u'since'], row[u's'])
+            end = min(t for t in (row[u'until'], row[u'u']) if t is not None) \
+                if row[u'until'] is not None or row[u'u'] is not None else None
+            if end is not None and end < start:
+                continue
+            for when, change in ((start, u'added'), (end, u'removed')):
+                if when is not None and (since is None or when >= since) and (until is None or when <= until):
+                    changes[(when, change, row[u'kind'], row[u'id'])] = row[u'name']
+        return [{u'time' : when, u'change' : change, u'kind' : kind, u'id' : id, u'name' : name}
+                for (when, change, kind, id), name in sorted(changes.items())]
+
+    def players(self):
+        """Returns every player with when it was last recorded."""
+        return self._query(u'select id, name, seen from players order by name', [])
+
+
+queries = {u'players-showing' : (u'players_showing', True),
+           u'content' : (u'content', False),
+           u'playlist-players' : (u'playlist_players', True),
+           u'history' : (u'history', True),
+           u'players' : (u'players', None)}
+
+
+def main():
+    parser = OptionParser(usage=__doc__)
+    parser.add_option(u'-s', u'--store', default=def_filename,
+        help=u'SQLite file to read (default: %default)')
+    parser.add_option(u'--since', help=u'Earliest time to consider')
+    parser.add_option(u'--until', help=u'Latest time to consider, or the time to show content at')
+    opts, args = parser.parse_args()
+    if not args or args[0] not in queries:
+        parser.error(u'one of these queries is needed: ' + u', '.join(sorted(queries)))
+    method, ranged = queries[args[0]]
+    if (ranged is None) != (len(args) == 1) or len(args) > 2:
+        parser.error(u'wrong number of arguments for ' + args[0])
+    try:
+        since, until = parse_when(opts.since), parse_when(opts.until)
+    except ValueError as e:
+        parser.error(unicode(e))
+
+    store = SnapshotStore(opts.store)
+    if ranged is None:
+        rows = getattr(store, method)()
+    elif ranged:
+        rows = getattr(store, method)(args[1].decode(sys.getfilesystemencoding() or u'utf-8'), since, until)
+    else:
+        rows = getattr(store, method)(args[1].decode(sys.getfilesystemencoding() or u'utf-8'), until)
+    for row in rows:
+        print json.dumps(row)
+
+if __name__ == '__main__':
+    main();
@@ -42,19 +42,10 @@ class ScalaConnector:
         return players[0].id
     
     def create_frameset_if_not_exists(self, frameset_name):
-        frameset_id = None
-        frameset_filter = scws.TObj()
-        frameset_filter.column       = u'name'
-        frameset_filter.restriction  = u'EQUALS'
-        frameset_filter.value        = frameset_name
-        our_framesets = self.content_manager.ChannelRS.listFramesets(searchCriteria=frameset_filter)
-        
-        #frameset already existing
-        if(our_framesets):
-            frameset_id = our_framesets[0].id
+        frameset_id = self.content_manager.resolve(u'frameset', frameset_name)
             
         #frameset not existing yet, create frameset and add frames
-        else:
+        if frameset_id is None:
             new_frameset = scws.TObj()
             new_frameset.name = frameset_name
             new_frameset.screenWidth = 3200
@@ -105,6 +96,7 @@ class ScalaConnector:
     
     def delete_and_create_playlist(self, playlist_name):
         #delete playlist from previous run
+        #every playlist of that name, the resolver only knows one of them
         playlist_filter = scws.TObj()
         playlist_filter.column       = u'name'
         playlist_filter.restriction  = u'EQUALS'
@@ -125,16 +117,8 @@ class ScalaConnector:
         return uploaded_pl[0].id
     
     def create_channel_if_not_exists(self, channel_name, frameset_id):
-        channel_id = None
-        channel_filter = scws.TObj()
-        channel_filter.column       = u'name'
-        channel_filter.restriction  = u'EQUALS'
-        channel_filter.value        = channel_name
-        
-        our_channels = self.content_manager.ChannelRS.list(searchCriteria=channel_filter)
-        if(our_channels):
-            channel_id = our_channels[0].id
-        else:
+        channel_id = self.content_manager.resolve(u'channel', channel_name)
+        if channel_id is None:
             new_channel = scws.TObj()
             new_channel.name = channel_name
             new_channel.description = u'This channel was created with the Scala scws lib'
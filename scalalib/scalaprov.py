@@ -34,7 +34,7 @@ if True:            # initialize, enable folding
         print 'ERROR:  Required modules missing, install Python for Scala.'
         sys.exit(3)
 
-    __version__             = '1.02'
+    __version__             = '1.03'
     _def_interval           = 1 * 60  # 5 mins
     _def_timing             = (13, 1, 0)
     _def_loglevel           = 'info'
@@ -48,6 +48,7 @@ if True:            # initialize, enable folding
     _ERR_NET                = 3
     _ERR_AUTH               = 4
     _ERR_MISC               = 5
+    _conmanagers            = {}      # (baseurl, authstr, api): ConManager
 
     # check for proxy settings, py env vars have an effect as well.
     _proxy_url = ''
@@ -458,6 +459,19 @@ def get_vnc_hash(password):
     return hashstr
 
 
+def _get_cm(baseurl, authstr, api_vers='v1'):
+    '''
+        Returns a ConManager shared by the functions of this module, so that
+        its name resolver tables are read once per provisioning run.
+    '''
+    key = (baseurl, authstr, api_vers)
+    cm = _conmanagers.get(key)
+    if cm is None:
+        cm = _conmanagers[key] = scws.ConManager(baseurl, authstr,
+            api_vers=api_vers)
+    return cm
+
+
 def player_create(name, baseurl, authstr, query=True, desc='', enabled=True):
     '''
         Creates a Player object in Content Manager, with the given name.
@@ -471,7 +485,7 @@ def player_create(name, baseurl, authstr, query=True, desc='', enabled=True):
             Player's Transfer Objec on success.
             None on failure, e.g. if query=False and Player already exists.
     '''
-    cm = scws.ConManager(baseurl, authstr)
+    cm = _get_cm(baseurl, authstr)
     try:
         pto = dict(name=name)
         if desc:  pto['description'] = desc
@@ -499,12 +513,11 @@ def player_query_ws(name, baseurl, authstr):
             Player's Transfer Object on success.
             None on failure.
     '''
-    cm = scws.ConManager(baseurl, authstr)
+    cm = _get_cm(baseurl, authstr)
 
-    src = dict(column='name', restriction='EQUALS', value=name)
-    players = cm.player.list(searchCriteria=src)
-    if players:
-        return players[0]
+    player = cm.resolver.get('player', name)
+    if player:
+        return player
     else:
         _log.critical('Player %s not found.' % name)
         sys.exit(_ERR_MISC)
@@ -560,14 +573,13 @@ def player_add_group(plr, group, baseurl, authstr):
             True on success.
             None on failure.
     '''
-    cm = scws.ConManager(baseurl, authstr, api_vers='v1.2')
+    cm = _get_cm(baseurl, authstr, api_vers='v1.2')
 
-    src = dict(column='name', restriction='EQUALS', value=group)
     try:
-        groups = cm.player.listPlayerGroups(searchCriteria=src)
-        if groups:
+        groupid = cm.resolve('playergroup', group)
+        if groupid is not None:
             cm.player.addPlayerGroup(dict(playerId=plr.id),
-                playerGroupId=groups[0].id)
+                playerGroupId=groupid)
             return True
         else:
             _log.error('Group %s not found.' % group)
@@ -587,28 +599,27 @@ def player_set_channel(plr, channel, baseurl, authstr):
             True on success.
             None on failure.
     '''
-    cm = scws.ConManager(baseurl, authstr)
+    cm = _get_cm(baseurl, authstr)
 
-    src = dict(column='name', restriction='EQUALS', value=channel)
     try:
-        # get channel ids
-        channels = cm.channel.list(searchCriteria=src)
-        if not channels:
+        # get channel id
+        channelid = cm.resolve('channel', channel)
+        if channelid is None:
             _log.error('Channel %s not found.' % channel)
             return
 
         displays = cm.player.getPlayerDisplays(playerId=plr.id)
         if displays:
             cm.player.updatePlayerDisplay( playerDisplay=
-                dict(id=displays[0].id, channelId=channels[0].id,
+                dict(id=displays[0].id, channelId=channelid,
                 screenCounter=1) )
             return True
         else:
             displays = cm.player.addPlayerDisplay( playerId=plr.id,
-                playerDisplay=dict(channelId=channels[0].id, screenCounter=1) )[0]
+                playerDisplay=dict(channelId=channelid, screenCounter=1) )[0]
             if displays:
                 cm.player.updatePlayerDisplay( playerDisplay=
-                    dict(id=displays[0].id, channelId=channels[0].id,
+                    dict(id=displays[0].id, channelId=channelid,
                     screenCounter=1) )
                 return True
             else:
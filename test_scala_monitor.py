@@ -0,0 +1,149 @@
+"""
+Tests of scala_monitor against a content manager stub answering from dictionaries, without a network.
+
+Command line usage:
+    python test_scala_monitor.py
+"""
+import unittest
+import scala_monitor
+import webservices.scws as scws
+
+
+class StubService:
+    def __init__(self, functions):
+        self.functions = functions
+
+    def __getattr__(self, name):
+        return self.functions[name]
+
+
+class StubContentManager:
+    """Answers PlaylistRS.getPlaylistItems from { playlist id : [PlaylistItemTO] },
+    PlayerRS.getPlayerDisplays from { player id : [PlayerDisplayTO] } and ChannelRS.getTimeslots
+    from { frame id : [TimeslotTO] }. PlaylistRS.get finds playlists in { playlist id : name }, and
+    MediaRS.get makes up any media asked for."""
+    def __init__(self, playlists, displays=None, timeslots=None, names=None):
+        self.playlists = playlists
+        self.displays = displays or {}
+        self.timeslots = timeslots or {}
+        self.names = names or {}
+        self.PlaylistRS = StubService({u'getPlaylistItems' : self.get_playlist_items, u'get' : self.get_playlist})
+        self.PlayerRS = StubService({u'getPlayerDisplays' : self.get_player_displays})
+        self.ChannelRS = StubService({u'getTimeslots' : self.get_timeslots})
+        self.MediaRS = StubService({u'get' : self.get_media})
+
+    def get_playlist_items(self, playlistId):
+        return self.playlists.get(playlistId, [])
+
+    def get_playlist(self, playlistId):
+        if playlistId not in self.names: return []
+        return [scws.PlaylistTO(id=playlistId, name=self.names[playlistId])]
+
+    def get_media(self, mediaId):
+        return [scws.MediaTO(id=mediaId, name=u'file' + mediaId, path=u'/content', mediaType=u'IMAGE')]
+
+    def get_timeslots(self, channel, frameId):
+        return self.timeslots.get(frameId, [])
+
+    def get_player_displays(self, playerId):
+        return self.displays.get(playerId, [])
+
+
+def media(item_id, media_id):
+    return scws.PlaylistItemTO(id=item_id, playlistItemType=u'MEDIA_ITEM', mediaId=media_id)
+
+
+def sub(item_id, playlist_id):
+    return scws.PlaylistItemTO(id=item_id, playlistItemType=u'SUB_PLAYLIST', playlistId=playlist_id)
+
+
+def display(display_id, channel_id):
+    return scws.PlayerDisplayTO(id=display_id, name=u'display ' + display_id, channelId=channel_id)
+
+
+def monitor(content_manager):
+    """Returns a ScalaMonitor asking content_manager rather than a CM over the network."""
+    monitor = scala_monitor.ScalaMonitor(u'http://localhost/', u'user:password', u'v1.2', workers=1)
+    monitor.content_manager = content_manager
+    monitor.new_snapshot()
+    return monitor
+
+
+class PlaylistExpanderTest(unittest.TestCase):
+
+    def setUp(self):
+        #1 plays file1 then 4, 4 plays file3 then 1 again
+        self.content_manager = StubContentManager({u'1' : [media(u'11', u'file1'), sub(u'12', u'4')],
+                                                   u'4' : [media(u'41', u'file3'), sub(u'42', u'1')]})
+
+    def expand(self, order):
+        expander = scala_monitor.PlaylistExpander(self.content_manager, workers=1)
+        return dict((id, [entry[u'media_id'] for entry in expander.expand(id)]) for id in order), expander
+
+    def test_cycle_in_either_order(self):
+        first, expander = self.expand([u'1', u'4'])
+        second = self.expand([u'4', u'1'])[0]
+        self.assertEqual(first, {u'1' : [u'file1', u'file3'], u'4' : [u'file3', u'file1']})
+        self.assertEqual(second, first)
+        self.assertEqual(expander.cycles, [(u'4', u'1'), (u'1', u'4')])
+
+    def test_shared_sub_playlist(self):
+        self.content_manager.playlists[u'2'] = [sub(u'21', u'4'), sub(u'22', u'1')]
+        found = self.expand([u'2'])[0]
+        self.assertEqual(found[u'2'], [u'file3', u'file1', u'file1', u'file3'])
+
+
+class InvalidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.content_manager = StubContentManager({}, {u'5' : [display(u'51', u'3')]})
+        self.monitor = monitor(self.content_manager)
+        self.monitor.indicators = {u'player' : {u'5' : u'1'}, u'channel' : {}, u'playlist' : {}, u'media' : {}}
+
+    def channels(self):
+        return [d.channelId for d in self.monitor.lookup(u'PlayerRS.getPlayerDisplays', playerId=u'5')]
+
+    def test_display_moved_to_another_channel(self):
+        #the player's own indicator stays the same
+        self.assertEqual(self.channels(), [u'3'])
+        self.content_manager.displays[u'5'] = [display(u'51', u'1')]
+        changes = self.monitor._invalidate(dict(self.monitor.indicators), workers=1)
+        self.assertEqual(changes[u'displays'], [u'5'])
+        self.assertEqual(changes[u'player'], [])
+        self.assertEqual(self.channels(), [u'1'])
+
+    def test_displays_unchanged(self):
+        self.channels()
+        changes = self.monitor._invalidate(dict(self.monitor.indicators), workers=1)
+        self.assertEqual(changes[u'displays'], [])
+
+
+class PlaylistInfoTest(unittest.TestCase):
+
+    def setUp(self):
+        #8 has items but is gone by the time it's looked up
+        self.content_manager = StubContentManager({u'7' : [media(u'71', u'1')], u'8' : [media(u'81', u'2')]},
+                                                  names={u'7' : u'playlist 7'})
+        self.monitor = monitor(self.content_manager)
+
+    def timeslots(self, *playlist_ids):
+        self.content_manager.timeslots[u'31'] = [scws.TimeslotTO(id=u't' + id, playlistId=id) for id in playlist_ids]
+        return self.monitor.get_playlist_info(u'3', u'31')
+
+    def test_playlist(self):
+        info = self.timeslots(u'7')
+        self.assertEqual(info.keys(), [u'playlist 7'])
+        self.assertEqual(info[u'playlist 7'][u'id'], u'7')
+        self.assertEqual(info[u'playlist 7'][u'items'].keys(), [u'file1'])
+
+    def test_missing_playlist(self):
+        try:
+            self.timeslots(u'7', u'8')
+        except ValueError as e:
+            self.assertEqual(unicode(e), u'No playlist found with id 8')
+        else:
+            self.fail(u'no ValueError for a missing playlist')
+
+
+if __name__ == '__main__':
+    unittest.main()
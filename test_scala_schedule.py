@@ -0,0 +1,161 @@
+"""
+Tests of the recurrence rules and the materialization window of scala_schedule.
+
+Command line usage:
+    python test_scala_schedule.py
+"""
+import datetime
+import random
+import unittest
+import scala_schedule
+import webservices.scws as scws
+from webservices import soaplib
+from datetime import datetime as D
+
+response = (u'<?xml version="1.0" encoding="utf-8"?>'
+    u'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+    u'<soap:Body><ns2:getTimeslotsResponse xmlns:ns2="http://v1.2.api.cm.scala.com">%s'
+    u'</ns2:getTimeslotsResponse></soap:Body></soap:Envelope>')
+
+
+def decode(*timeslots):
+    """Returns TimeslotTOs as ChannelRS.getTimeslots() builds them, from the XML of each timeslot."""
+    body = response % u''.join(u'<return>%s</return>' % timeslot for timeslot in timeslots)
+    return [scws.TimeslotTO(**fields) for fields in
+            soaplib.xml2list(body, u'{http://v1.2.api.cm.scala.com}getTimeslotsResponse')]
+
+
+def starts(schedule, start, end):
+    return [(row[u'timeslot_id'], row[u'start']) for row in schedule.between(start, end)]
+
+
+class RecurrenceTest(unittest.TestCase):
+
+    def test_decoded_weekdays(self):
+        timeslot, = decode(u'<id>1</id><startDate>2013-08-01</startDate><startTime>09:00:00</startTime>'
+                           u'<endTime>10:00:00</endTime><recurrencePattern>WEEKLY</recurrencePattern>'
+                           u'<weekdays>MONDAY</weekdays><weekdays>WEDNESDAY</weekdays><weekdays>FRIDAY</weekdays>')
+        days = scala_schedule.recurrence_days(timeslot, datetime.date(2013, 8, 5), datetime.date(2013, 8, 11))
+        self.assertEqual(days, [datetime.date(2013, 8, 5), datetime.date(2013, 8, 7), datetime.date(2013, 8, 9)])
+
+    def test_decoded_weekdays_numbered_past_ten(self):
+        #with 10 or more elements the decoder pads the numbers, and numbers them across all repeated tags
+        fields = u''.join(u'<weekdays>%s</weekdays>' % day for day in scala_schedule.weekdays)
+        timeslot, = decode(u'<id>1</id><startDate>2013-08-01</startDate><recurrencePattern>WEEKLY'
+                           u'</recurrencePattern><channelId>3</channelId><channelId>4</channelId>' + fields)
+        self.assertTrue(u'weekdays.07' in timeslot.__get_dict__())
+        days = scala_schedule.recurrence_days(timeslot, datetime.date(2013, 8, 5), datetime.date(2013, 8, 11))
+        self.assertEqual(len(days), 7)
+
+    def test_weekdays_list(self):
+        timeslot = {u'startDate' : u'2013-08-01', u'recurrencePattern' : u'WEEKLY',
+                    u'weekdays' : [u'TUESDAY', u'sunday']}
+        days = scala_schedule.recurrence_days(timeslot, datetime.date(2013, 8, 5), datetime.date(2013, 8, 11))
+        self.assertEqual(days, [datetime.date(2013, 8, 6), datetime.date(2013, 8, 11)])
+
+    def test_weekly_defaults_to_start_weekday(self):
+        timeslot = {u'startDate' : u'2013-08-01', u'recurrencePattern' : u'WEEKLY'}     #a Thursday
+        days = scala_schedule.recurrence_days(timeslot, datetime.date(2013, 8, 1), datetime.date(2013, 8, 20))
+        self.assertEqual(days, [datetime.date(2013, 8, 1), datetime.date(2013, 8, 8), datetime.date(2013, 8, 15)])
+
+    def test_daily_clipped_to_dates(self):
+        timeslot = {u'startDate' : u'2013-08-03', u'endDate' : u'2013-08-05', u'recurrencePattern' : u'DAILY'}
+        days = scala_schedule.recurrence_days(timeslot, datetime.date(2013, 8, 1), datetime.date(2013, 8, 31))
+        self.assertEqual(days, [datetime.date(2013, 8, 3), datetime.date(2013, 8, 4), datetime.date(2013, 8, 5)])
+
+    def test_monthly_day_of_month(self):
+        timeslot = {u'startDate' : u'2013-01-15', u'recurrencePattern' : u'MONTHLY', u'monthPeriod' : u'2',
+                    u'recurrenceDayOfMonth' : u'20'}
+        days = scala_schedule.recurrence_days(timeslot, datetime.date(2013, 1, 1), datetime.date(2013, 6, 30))
+        self.assertEqual(days, [datetime.date(2013, 1, 20), datetime.date(2013, 3, 20), datetime.date(2013, 5, 20)])
+
+    def test_monthly_week_of_month(self):
+        timeslot = {u'startDate' : u'2013-08-01', u'recurrencePattern' : u'MONTHLY',
+                    u'recurrenceWeekOfMonth' : u'LAST', u'recurrenceDayOfWeek' : u'FRIDAY'}
+        days = scala_schedule.recurrence_days(timeslot, datetime.date(2013, 8, 1), datetime.date(2014, 1, 31))
+        self.assertEqual([day.day for day in days], [30, 27, 25, 29, 27, 31])
+
+    def test_overnight_and_end_of_day(self):
+        overnight = {u'startDate' : u'2013-08-01', u'recurrencePattern' : u'DAILY',
+                     u'startTime' : u'22:00:00', u'endTime' : u'02:00:00'}
+        self.assertEqual(scala_schedule.occurrences(overnight, datetime.date(2013, 8, 1), datetime.date(2013, 8, 1)),
+                         [(D(2013, 8, 1, 22), D(2013, 8, 2, 2))])
+        whole_day = {u'startDate' : u'2013-08-01', u'recurrencePattern' : u'DAILY',
+                     u'startTime' : u'00:00:00', u'endTime' : u'23:59:59'}
+        self.assertEqual(scala_schedule.occurrences(whole_day, datetime.date(2013, 8, 1), datetime.date(2013, 8, 1)),
+                         [(D(2013, 8, 1), D(2013, 8, 2))])
+
+    def test_once_spans_dates(self):
+        timeslot = {u'startDate' : u'2013-08-05', u'endDate' : u'2013-08-07',
+                    u'startTime' : u'12:00:00', u'endTime' : u'13:00:00'}
+        self.assertEqual(scala_schedule.occurrences(timeslot, datetime.date(2013, 8, 1), datetime.date(2013, 8, 31)),
+                         [(D(2013, 8, 5, 12), D(2013, 8, 7, 13))])
+
+
+class FrameScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.timeslots = decode(
+            u'<id>1</id><playlistId>A</playlistId><startDate>2000-01-03</startDate><startTime>09:00:00</startTime>'
+            u'<endTime>10:00:00</endTime><recurrencePattern>WEEKLY</recurrencePattern>'
+            u'<weekdays>MONDAY</weekdays><weekdays>WEDNESDAY</weekdays><weekdays>FRIDAY</weekdays>',
+            u'<id>2</id><playlistId>B</playlistId><startDate>2000-01-01</startDate><startTime>22:00:00</startTime>'
+            u'<endTime>02:00:00</endTime><recurrencePattern>DAILY</recurrencePattern>',
+            u'<id>3</id><playlistId>C</playlistId><startDate>2001-06-01</startDate><endDate>2001-06-03</endDate>'
+            u'<startTime>12:00:00</startTime><endTime>13:00:00</endTime>')
+        self.today = datetime.date(2013, 8, 7)      #a Wednesday
+        self.schedule = scala_schedule.FrameSchedule(self.timeslots, horizon=10, today=self.today, history=5)
+
+    def test_window_around_today(self):
+        self.assertEqual(self.schedule.since, datetime.date(2013, 8, 2))
+        self.assertEqual(self.schedule.until, datetime.date(2013, 8, 17))
+        self.assertEqual(min(interval[0] for interval in self.schedule.index.intervals if interval[2] != 2),
+                         D(2013, 8, 2, 9))
+
+    def test_at(self):
+        found = self.schedule.at(D(2013, 8, 9, 9, 30))
+        self.assertEqual([(row[u'timeslot_id'], row[u'playlist_id']) for row in found], [(u'1', u'A')])
+        self.assertEqual(self.schedule.at(D(2013, 8, 10, 9, 30)), [])
+        self.assertEqual([row[u'timeslot_id'] for row in self.schedule.at(D(2013, 8, 10, 1))], [u'2'])
+
+    def test_between(self):
+        self.assertEqual(starts(self.schedule, D(2013, 8, 12), D(2013, 8, 13)),
+                         [(u'2', D(2013, 8, 11, 22)), (u'1', D(2013, 8, 12, 9)), (u'2', D(2013, 8, 12, 22))])
+
+    def test_extends_forward(self):
+        self.assertEqual([row[u'start'] for row in self.schedule.at(D(2020, 1, 1, 9, 30))], [D(2020, 1, 1, 9)])
+        self.assertTrue(self.schedule.until >= datetime.date(2020, 1, 1))
+
+    def test_extends_back(self):
+        #an occurrence from the day before the window still playing at its start
+        self.assertEqual(starts(self.schedule, D(2013, 8, 2, 1), D(2013, 8, 2, 2)), [(u'2', D(2013, 8, 1, 22))])
+        self.assertEqual(starts(self.schedule, D(2005, 3, 7, 9), D(2005, 3, 7, 10)), [(u'1', D(2005, 3, 7, 9))])
+        self.assertTrue(self.schedule.since <= datetime.date(2005, 3, 6))
+
+    def test_once_outside_window(self):
+        self.assertEqual(self.schedule.overlaps(), [])
+        self.assertEqual(starts(self.schedule, D(2001, 6, 2), D(2001, 6, 2, 1)),
+                         [(u'3', D(2001, 6, 1, 12)), (u'2', D(2001, 6, 1, 22))])
+        found = self.schedule.overlaps(D(2001, 6, 1), D(2001, 6, 4))
+        self.assertEqual([(row[u'timeslots'], row[u'count']) for row in found], [([u'2', u'3'], 2)])
+
+
+class IntervalIndexTest(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        rand = random.Random(1)
+        base = D(2013, 1, 1)
+        intervals = []
+        for i in range(2000):
+            start = base + datetime.timedelta(minutes=rand.randint(0, 50000))
+            intervals.append((start, start + datetime.timedelta(minutes=rand.choice([1, 30, 600, 6000])), i))
+        index = scala_schedule.IntervalIndex(intervals)
+        for i in range(200):
+            start = base + datetime.timedelta(minutes=rand.randint(-1000, 51000))
+            end = start + datetime.timedelta(minutes=rand.choice([1, 100, 5000]))
+            self.assertEqual(index.overlapping(start, end),
+                             sorted(interval for interval in intervals if interval[0] < end and interval[1] > start))
+
+
+if __name__ == '__main__':
+    unittest.main()
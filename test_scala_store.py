@@ -0,0 +1,57 @@
+"""
+Tests of scala_store, recording get_player_info() output into an in-memory SQLite database.
+
+Command line usage:
+    python test_scala_store.py
+"""
+import unittest
+import scala_store
+
+
+def frame(frame_id, z):
+    return {u'id' : frame_id, u'name' : u'frame ' + frame_id, u'top_left' : {u'x' : 0, u'y' : 0},
+            u'dimensions' : {u'width' : 1920, u'height' : 1080}, u'z-index' : z}
+
+
+def playlist(playlist_id, frame_ids, *media_ids):
+    items = dict((u'file' + id, {u'id' : id, u'path' : u'/content', u'type' : u'IMAGE'}) for id in media_ids)
+    return {u'id' : playlist_id, u'frames' : frame_ids, u'items' : items,
+            u'loop_length' : {u'seconds' : 10.0 * len(media_ids), u'items' : len(media_ids), u'unknown' : 0}}
+
+
+def player_info(frames, playlists):
+    return {u'id' : u'1', u'name' : u'screen', u'displays' : [{u'id' : u'11', u'name' : u'display'}],
+            u'channel' : {u'id' : u'3', u'name' : u'channel'},
+            u'frame_info' : {u'id' : u'30', u'name' : u'frameset', u'frames' : frames},
+            u'playlists' : playlists}
+
+
+class RecordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = scala_store.SnapshotStore(u':memory:')
+        self.store.record(player_info([frame(u'31', 0), frame(u'32', 1)],
+                                      {u'main' : playlist(u'100', [u'31'], u'1', u'2'),
+                                       u'ticker' : playlist(u'200', [u'32'], u'3')}), now=100)
+
+    def showing(self):
+        return sorted(row[u'id'] for row in self.store.content(u'screen'))
+
+    def test_unchanged_adds_nothing(self):
+        self.store.record(player_info([frame(u'31', 0), frame(u'32', 1)],
+                                      {u'main' : playlist(u'100', [u'31'], u'1', u'2'),
+                                       u'ticker' : playlist(u'200', [u'32'], u'3')}), now=200)
+        self.assertEqual(self.showing(), [u'1', u'2', u'3'])
+        self.assertEqual(self.store.db.execute(u'select count(*) from frame_playlist').fetchone()[0], 2)
+
+    def test_frame_removed(self):
+        self.store.record(player_info([frame(u'31', 0)], {u'main' : playlist(u'100', [u'31'], u'1', u'2')}),
+                          now=200)
+        self.assertEqual(self.showing(), [u'1', u'2'])
+        self.assertEqual(sorted(row[u'id'] for row in self.store.content(u'screen', at=150)), [u'1', u'2', u'3'])
+        removed = [(row[u'id'], row[u'time']) for row in self.store.history(u'screen') if row[u'change'] == u'removed']
+        self.assertEqual(sorted(removed), [(u'200', 200), (u'3', 200)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,7 +22,7 @@ if True:  # initialization
     import win32_unicode_argv
 
     # set up a few default variables first
-    __version__     = '1.14'
+    __version__     = '1.17'
     _ex_authstr     = 'scalaweb:pword'
     _ex_network     = 'Company'
     _ex_baseurl     = 'http://cm.myco.com:8080/ContentManager/'
@@ -47,6 +47,15 @@ def setup():
         help='Base URL destination to Content Manager, e.g. "%s"' % _ex_baseurl)
     parser.add_option('-d', '--dest', metavar='URL',
         help='Deprecated.  Use -b instead.')
+    parser.add_option('-f', '--manifest', metavar='FILE',
+        help='Skip files whose content was uploaded before, as recorded in '
+        'this manifest file.')
+    parser.add_option('-m', '--max-rate', metavar='KBPS', type='int',
+        help='Cap the combined upload rate at this many KiB per second.')
+    parser.add_option('-W', '--window', metavar='HH:MM-HH:MM[=KBPS]',
+        action='append', default=[],
+        help='Limit the rate only within this time of day, at KBPS or '
+        'the max-rate.  May be given more than once.')
     parser.add_option('-n', '--network',
         metavar='NET', help='CM network, e.g. "%s"' % _ex_network)
     parser.add_option('-s', '--subfolder', metavar='STR',
@@ -57,11 +66,20 @@ def setup():
         help='Enable verbose output of the upload process.')
     parser.add_option('-V', '--very-verbose', action='store_true',
         help='Enable verbose debugging output of the HTTP/SOAP protocol.')
+    parser.add_option('--verify', action='store_true',
+        help='With --manifest, check that recorded media still exist on the CM.')
+    parser.add_option('-w', '--workers', metavar='NUM', type='int', default=1,
+        help='Number of files to upload at once.  Default: %default.')
 
     (opts, args) = parser.parse_args()
     if not args:
         parser.print_help()
         sys.exit(ERR_FILE)
+    try:
+        opts.windows = [ parse_window(window, opts.max_rate)
+            for window in opts.window ]
+    except ValueError:
+        parser.error('Window format is HH:MM-HH:MM[=KBPS]')
 
     # set up a logging channel
     import scalalib
@@ -84,11 +102,32 @@ def setup():
         log.error('Authstr is required.')
         sys.exit(ERR_AUTH)
 
+def parse_window(window, max_rate):
+    'Returns an (open, close, bytes per second) tuple for the RateLimiter.'
+    times, rate = (window.split('=', 1) + [max_rate])[:2]
+    opentime, closetime = times.split('-')
+    for timestr in (opentime, closetime):
+        hours, minutes = map(int, timestr.split(':'))
+        if not (0 <= hours < 24 and 0 <= minutes < 60):
+            raise ValueError, timestr
+    if not rate:  raise ValueError, window
+    return (opentime, closetime, int(rate) * 1024)
+
+
 def main():
     ' Get list of files and upload.'
     log.debug('%s v%s  scws:v%s  soaplib:v%s' % (sys.argv[0], __version__,
         scws.__version__, soaplib.__version__))
     cm = scws.ConManager(opts.baseurl, opts.authstr)   # Create a CM object
+    if opts.windows:    # one limiter shared by all uploads
+        soaplib.default_limiter = soaplib.RateLimiter(None,
+            windows=opts.windows)
+    elif opts.max_rate:
+        soaplib.default_limiter = soaplib.RateLimiter(opts.max_rate * 1024)
+    manifest = None
+    if opts.manifest:   manifest = scws.UploadManifest(opts.manifest)
+    if opts.workers > 1:
+        return upload_parallel(cm, manifest)
     Errors = None
 
     for filename in args:
@@ -98,7 +137,8 @@ def main():
                 sys.stdout.flush()
             fileIds = cm.upload_file(filename, opts.network,
                 subfolder=opts.subfolder, upload_method='PUT',
-                upload_type=opts.upload_type)
+                upload_type=opts.upload_type, manifest=manifest,
+                verify=opts.verify)
             log.info('uploaded %s' % filename)
             if not opts.verbose or opts.very_verbose:
                 print 'Done.'
@@ -112,6 +152,28 @@ def main():
         return ERR_UPLD
 
 
+def upload_parallel(cm, manifest):
+    'Upload all files with several workers, then report on each.'
+    try:
+        results = cm.upload_file(args, opts.network, subfolder=opts.subfolder,
+            upload_method='PUT', upload_type=opts.upload_type,
+            workers=opts.workers, raise_errors=False, manifest=manifest,
+            verify=opts.verify)
+    except KeyboardInterrupt:
+        log.warn('Killed by Ctrl-C.')
+        return ERR_KILL
+
+    Errors = None
+    for filename, result in zip(args, results):
+        if isinstance(result, Exception):
+            print 'failed:   ', filename, '-', result
+            Errors = True
+        elif not opts.verbose or opts.very_verbose:
+            print 'uploaded: ', filename, '- id', result
+    if Errors:
+        return ERR_UPLD
+
+
 if __name__ == "__main__":
     setup()
     sys.exit(main())
@@ -32,27 +32,595 @@
         for template in templates:
             print ' *', template.name
 
+        # Independent calls can be sent concurrently, results keep their order
+        medias = cm.map('MediaRS.get', [ dict(mediaId=i) for i in ids ])
+
     Next, see the tutorial at:
        https://developer.scala.com/dev/index.php/WebServicesTutorial
 '''
 if True:    # initialize vars and enable folding
-    import os
+    import os, time
     import logging
+    try:                    from hashlib import sha1
+    except ImportError:     from sha import new as sha1     # py2.4
+    import threading, Queue
+    import httplib as http              # to use its constants
     import soaplib
     try:
         import scalalib as sl
     except (ImportError, AttributeError):
         sl = None
 
-    __version__ = '1.25'
-    __all__ = ['ConManager', 'TObj', 'soaplib', 'logging']
+    __version__ = '1.38'
+    __all__ = ['ConManager', 'ResponseCache', 'Resolver', 'TObj',
+        'UploadManifest', 'file_digest', 'map_concurrent', 'soaplib',
+        'logging', 'ChannelTO', 'FrameTO', 'FramesetTO', 'MediaTO',
+        'MetadataTO', 'MetaValueTO', 'PlayerTO', 'PlayerDisplayTO',
+        'PlaylistTO', 'PlaylistItemTO', 'TimeslotTO', 'UploadFileTO']
     _def_api_vers   = 'v1'
     _def_namespace  = 'ns2'
+    _def_workers    = 8         # concurrent calls in ConManager.batch/map
+    _def_page_size  = 500       # items per page in ConManager.iter_list
+    _def_cache_ttl  = 60        # seconds a cached response stays valid
+    _def_cache_size = 1000      # responses kept by a ResponseCache
+    _def_hash_workers = 2       # files hashed at once during upload_file
+    _def_hash_block = 1048576   # bytes read at a time when hashing
     loggername = 'scalalib.' + __name__
     log = logging.getLogger(loggername)
     if sl and hasattr(sl, '_nullh'):    # if not available or old vers
         log.addHandler(sl._nullh)       # quiet "no handler" error messages
 
+    try:   http.OK                      # ensure compatibility with py 2.3
+    except AttributeError:
+        http.OK, http.INTERNAL_SERVER_ERROR, http.NOT_FOUND = 200, 500, 404
+
+
+def map_concurrent(func, items, workers=_def_workers):
+    '''
+        Apply func to each of items on a bounded pool of threads.
+
+        Arguments:
+            func        - A callable taking a single item.
+            items       - A sequence of items.
+        Options:
+            workers     - Maximum number of threads to run at once.
+        Returns:
+            A list of results in the same order as items.  If func raised an
+            exception for an item, the exception instance takes its place
+            rather than aborting the remaining items.
+    '''
+    items = list(items)
+    results = [None] * len(items)
+    def run(index):
+        try:                    results[index] = func(items[index])
+        except Exception, e:    results[index] = e
+
+    if workers <= 1 or len(items) <= 1:
+        for index in range(len(items)):
+            run(index)
+        return results
+
+    queue = Queue.Queue()
+    for index in range(len(items)):
+        queue.put(index)
+    def worker():
+        while True:
+            try:                index = queue.get_nowait()
+            except Queue.Empty: return
+            run(index)
+
+    threads = [ threading.Thread(target=worker)
+        for i in range(min(workers, len(items))) ]
+    for thread in threads:
+        thread.setDaemon(True)              # don't hang the process on exit
+        thread.start()
+    for thread in threads:
+        while thread.isAlive():             # stay responsive to Ctrl-C
+            thread.join(0.5)
+    return results
+
+
+class _Future(object):
+    '''
+        Runs a function in a background thread, result() waits for it and
+        returns its value or raises its exception.
+    '''
+    def __init__(self, func, *args, **kwargs):
+        self._result = self._error = None
+        def run():
+            try:                    self._result = func(*args, **kwargs)
+            except Exception, e:    self._error = e
+        self._thread = threading.Thread(target=run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def result(self):
+        while self._thread.isAlive():       # stay responsive to Ctrl-C
+            self._thread.join(0.5)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def _service_name(servicename):
+    'Returns the lowercase URL name of a service, e.g.: PlayerRS -> player'
+    if servicename.endswith('RS'):      # remove it and lower first capital
+        return servicename[0].lower() + servicename[1:-2]
+    return servicename
+
+
+class ResponseCache(object):
+    '''
+        A cache of responses to read-only Content Manager calls, keyed on
+        service, function and arguments.
+
+        Functions whose names start with "get" or "list" are cached; calls
+        to a function starting with one of the mutating prefixes (create,
+        update, delete, add...) drop every cached response of that service.
+        The least recently used responses are dropped beyond maxsize.
+        Each caller gets its own copy of the cached TObjs, so a result may be
+        modified, e.g. to pass back to an update call, without changing what
+        other callers get.
+
+        Example:
+            cache = scws.ResponseCache(ttl=300, ttls={'PlanGeneratorRS':0})
+            cm = scws.ConManager(baseurl, authstr, cache=cache)
+            ...
+            cm.cache.invalidate('PlaylistRS')
+            print cm.cache.stats()
+    '''
+    read_prefixes = ('get', 'list')
+    write_prefixes = ('create', 'update', 'delete', 'add', 'remove', 'set',
+        'move', 'copy')
+
+    def __init__(self, ttl=_def_cache_ttl, maxsize=_def_cache_size, ttls=None):
+        '''
+            Options:
+                ttl         - Seconds a response remains valid.
+                maxsize     - Maximum number of responses to keep.
+                ttls        - A dictionary of per-service ttls overriding ttl,
+                              e.g.: {'MediaRS':600}.  Zero disables caching.
+        '''
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.ttls = {}
+        for name, seconds in (ttls or {}).items():
+            self.ttls[_service_name(name)] = seconds
+        self._lock = threading.Lock()
+        self._entries = {}                  # key: [prev, next, key, value, exp]
+        self._root = root = []              # sentinel of the LRU ring
+        root[:] = [root, root, None, None, None]
+        self._generations = {}              # service: count of invalidations
+        self._stats = dict(hits=0, misses=0, expired=0, evicted=0,
+            invalidated=0)
+
+    def _normalize(self, value):
+        'Returns a hashable equivalent of an argument, as it would be sent.'
+        if isinstance(value, TObj):
+            value = value.__get_dict__(includetype=True)
+        if isinstance(value, dict):
+            items = [ (key, self._normalize(val)) for key, val in value.items() ]
+            items.sort()
+            return tuple(items)
+        elif isinstance(value, (list, tuple)):
+            return tuple([ self._normalize(val) for val in value ])
+        elif type(value) is bool:
+            return str(value).lower()       # as sent to the CM
+        elif value is None:
+            return None
+        return unicode(value)
+
+    def call(self, service, functionname, args, kwargs, fetch):
+        '''
+            Returns the cached response to a call if there is a valid one,
+            otherwise calls fetch(functionname, args, kwargs) and caches the
+            result if the function is read-only.
+        '''
+        if functionname.startswith(self.write_prefixes):
+            try:        return fetch(functionname, args, kwargs)
+            finally:    self.invalidate(service)
+
+        ttl = self.ttls.get(service, self.ttl)
+        if not ttl or not functionname.startswith(self.read_prefixes):
+            return fetch(functionname, args, kwargs)
+
+        key = (service, functionname, self._normalize(args),
+            self._normalize(kwargs))
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[4] > time.time():
+                    self._stats['hits'] += 1
+                    self._unlink(entry)             # move to front
+                    self._link(entry)
+                    return _copy_value(entry[3])    # caller may modify it
+                self._stats['expired'] += 1
+                self._remove(entry)
+            self._stats['misses'] += 1
+            generation = self._generations.get(service, 0)
+        finally:
+            self._lock.release()
+
+        value = fetch(functionname, args, kwargs)
+
+        self._lock.acquire()
+        try:    # don't store if the service changed while in flight
+            if generation == self._generations.get(service, 0):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._remove(entry)
+                entry = [None, None, key, value, time.time() + ttl]
+                self._entries[key] = entry
+                self._link(entry)
+                while len(self._entries) > self.maxsize:
+                    self._stats['evicted'] += 1
+                    self._remove(self._root[0])     # least recently used
+        finally:
+            self._lock.release()
+        return _copy_value(value)
+
+    def _link(self, entry):
+        'Insert an entry at the most recently used end of the ring.'
+        root = self._root
+        entry[0], entry[1] = root, root[1]
+        root[1][0] = root[1] = entry
+
+    def _unlink(self, entry):
+        entry[0][1], entry[1][0] = entry[1], entry[0]
+
+    def _remove(self, entry):
+        self._unlink(entry)
+        del self._entries[entry[2]]
+
+    def invalidate(self, service=None, functionname=None):
+        '''
+            Drop cached responses.
+            Options:
+                service         - Only those of this service, e.g. "MediaRS".
+                functionname    - Only those of this function of the service.
+        '''
+        if service is not None:
+            service = _service_name(service)
+        self._lock.acquire()
+        try:
+            for key, entry in self._entries.items():
+                if service is None or (key[0] == service and
+                    functionname in (None, key[1])):
+                    self._remove(entry)
+                    self._stats['invalidated'] += 1
+            if service is None:
+                services = self._generations.keys()
+            else:
+                services = [service]
+            for name in services:
+                self._generations[name] = self._generations.get(name, 0) + 1
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        '''
+            Returns a dictionary of counters:
+                hits, misses, expired, evicted, invalidated, size
+        '''
+        self._lock.acquire()
+        try:
+            result = dict(self._stats)
+            result['size'] = len(self._entries)
+        finally:
+            self._lock.release()
+        return result
+
+
+def file_digest(filename, blocksize=_def_hash_block):
+    'Returns the hex SHA-1 digest of a file, read a block at a time.'
+    digest = sha1()
+    infile = open(filename, 'rb')
+    try:
+        while True:
+            block = infile.read(blocksize)
+            if not block: break
+            digest.update(block)            # releases the GIL on large blocks
+    finally:
+        infile.close()
+    return digest.hexdigest()
+
+
+class _DigestPool(object):
+    '''
+        Hashes a list of files in the background on a few threads, get()
+        waits for the digest of one of them.  Used to overlap the hashing of
+        later files with the upload of earlier ones.
+    '''
+    def __init__(self, filenames, workers=_def_hash_workers):
+        self._digests = [None] * len(filenames)
+        self._events = [ threading.Event() for name in filenames ]
+        def run(index):
+            try:
+                self._digests[index] = file_digest(filenames[index])
+            finally:
+                self._events[index].set()
+        self._future = _Future(map_concurrent, run, range(len(filenames)),
+            workers=workers)
+
+    def get(self, index):
+        'Returns the digest of the file at index, or None if unreadable.'
+        event = self._events[index]
+        while not event.isSet():            # stay responsive to Ctrl-C
+            event.wait(0.5)
+        return self._digests[index]
+
+
+class UploadManifest(object):
+    '''
+        A local record of the content uploaded to Content Managers, used by
+        ConManager.upload_file to skip files that are already there.  It
+        holds the SHA-1 digest and mediaId of the content last uploaded to
+        each network and destination path, and finds content already
+        uploaded to a network under another name or folder by its digest.
+
+        The manifest is kept in a JSON file if given a filename, loaded when
+        created and written by save().
+
+        Example:
+            manifest = scws.UploadManifest('uploads.json')
+            ids = cm.upload_file(names, 'SCALA_CUSTOMER', manifest=manifest)
+    '''
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._entries = {}          # (network, path): (digest, mediaId)
+        self._paths = {}            # (network, digest): path
+        self._lock = threading.Lock()
+        self._dirty = False
+        if filename and os.path.exists(filename):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        'Read entries from the manifest file, replacing those in memory.'
+        import json
+        infile = open(self.filename, 'rb')
+        try:        data = json.load(infile)
+        finally:    infile.close()
+        entries, paths = {}, {}
+        for digest, network, path, mediaId in data.get('entries', []):
+            entries[(network, path)] = (digest, mediaId)
+            paths.setdefault((network, digest), path)
+        self._lock.acquire()
+        try:
+            self._entries = entries
+            self._paths = paths
+            self._dirty = False
+        finally:
+            self._lock.release()
+
+    def save(self):
+        'Write entries to the manifest file if they have changed.'
+        if not (self.filename and self._dirty): return
+        import json
+        self._lock.acquire()
+        try:
+            entries = [ [digest, network, path, mediaId] for (network, path),
+                (digest, mediaId) in sorted(self._entries.items()) ]
+            self._dirty = False
+        finally:
+            self._lock.release()
+
+        tempname = self.filename + '.tmp'   # don't leave a partial manifest
+        outfile = open(tempname, 'wb')
+        try:        json.dump(dict(version=1, entries=entries), outfile)
+        finally:    outfile.close()
+        if os.name == 'nt' and os.path.exists(self.filename):
+            os.remove(self.filename)        # rename won't replace on win32
+        os.rename(tempname, self.filename)
+
+    def lookup(self, digest, network, path):
+        'Returns the mediaId of content uploaded to network/path, or None.'
+        entry = self._entries.get((network, path))
+        if entry and entry[0] == digest:
+            return entry[1]
+
+    def find(self, digest, network):
+        '''
+            Returns (path, mediaId) of the same content uploaded to network
+            under any path, or None.
+        '''
+        self._lock.acquire()
+        try:
+            path = self._paths.get((network, digest))
+            if path is not None:
+                return path, self._entries[(network, path)][1]
+        finally:
+            self._lock.release()
+
+    def record(self, digest, network, path, mediaId):
+        'Remember content uploaded to network/path, replacing older content.'
+        self._lock.acquire()
+        try:
+            old = self._entries.get((network, path))
+            if old and old[0] != digest:
+                self._unindex(old[0], network, path)
+            self._entries[(network, path)] = (digest, mediaId)
+            self._paths.setdefault((network, digest), path)
+            self._dirty = True
+        finally:
+            self._lock.release()
+
+    def forget(self, digest, network, path):
+        'Drop an entry, e.g. when its media item no longer exists.'
+        self._lock.acquire()
+        try:
+            entry = self._entries.get((network, path))
+            if entry and entry[0] == digest:
+                del self._entries[(network, path)]
+                self._unindex(digest, network, path)
+                self._dirty = True
+        finally:
+            self._lock.release()
+
+    def _unindex(self, digest, network, path):
+        'Point the digest index at another path with the content, if any.'
+        if self._paths.get((network, digest)) != path:  return
+        del self._paths[(network, digest)]
+        for (other_network, other), entry in self._entries.items():
+            if other_network == network and entry[0] == digest:
+                self._paths[(network, digest)] = other
+                break
+
+
+class Resolver(object):
+    '''
+        Resolves names of Content Manager entities to ids, from a table of
+        all entities of a type read with one list call on first use.  The
+        tables are kept current with the create, update and delete calls
+        of each type made through the same ConManager, other calls leave
+        them alone; refresh() re-reads them to pick up changes made by
+        others.  Each type is read under its own lock, so a lookup only
+        waits for a list call of the type it needs.
+
+        Example:
+            channelId = cm.resolve('channel', 'Lobby')
+            player = cm.resolver.get('player', 'Lobby 01')  # whole TObj
+            cm.resolver.refresh('channel')
+    '''
+    write_prefixes = ('create', 'update', 'delete')
+    # type: (service, list function, id argument, create, update, delete)
+    entity_types = {
+        'channel':      ('channel', 'list', 'channelId', 'create', 'update',
+                            'delete'),
+        'frameset':     ('channel', 'listFramesets', 'framesetId',
+                            'createFrameset', 'updateFrameset',
+                            'deleteFrameset'),
+        'media':        ('media', 'list', 'mediaId', None, 'update',
+                            'delete'),
+        'message':      ('message', 'list', 'messageId', 'create', 'update',
+                            'delete'),
+        'player':       ('player', 'list', 'playerId', 'create', 'update',
+                            'delete'),
+        'playergroup':  ('player', 'listPlayerGroups', 'playerGroupId',
+                            'createPlayerGroup', 'updatePlayerGroup',
+                            'deletePlayerGroup'),
+        'playlist':     ('playlist', 'list', 'playlistId', 'create',
+                            'update', 'delete'),
+        'template':     ('template', 'list', 'templateId', 'create',
+                            'update', 'delete'),
+        }
+
+    def __init__(self, conmanager):
+        self.cm = conmanager
+        self._tables = {}                   # type: {name: TObj}
+        self._generations = {}              # type: writes seen, see _table
+        self._lock = threading.Lock()       # guards the two above
+        self._loading = dict( (entity, threading.Lock())
+            for entity in self.entity_types )
+
+    def _entity_type(self, entity):
+        'Returns the normalized name of an entity type, e.g. ChannelRS.'
+        name = _service_name(entity).lower()
+        if name not in self.entity_types:
+            raise ValueError, 'Entity type: "%s" unknown.' % entity
+        return name
+
+    def _table(self, entity):
+        'Returns the name table of an entity type, reading it if needed.'
+        table = self._tables.get(entity)
+        if table is not None:
+            return table
+        self._loading[entity].acquire()     # one read per type at a time
+        try:
+            self._lock.acquire()
+            try:
+                table = self._tables.get(entity)
+                generation = self._generations.get(entity, 0)
+            finally:
+                self._lock.release()
+            if table is not None:           # read while we waited
+                return table
+
+            servicename, listname = self.entity_types[entity][:2]
+            listfunc = getattr(getattr(self.cm, servicename), listname)
+            table = {}
+            for item in listfunc():
+                table.setdefault(item.name, item)   # first one, as before
+            log.debug('resolver: %s %s entities', len(table), entity)
+            self._lock.acquire()
+            try:    # keep it unless written to or refreshed while reading
+                if self._generations.get(entity, 0) == generation:
+                    self._tables[entity] = table
+            finally:
+                self._lock.release()
+            return table
+        finally:
+            self._loading[entity].release()
+
+    def get(self, entity, name, refresh=False):
+        'Returns the TObj of the named entity, or None if not found.'
+        entity = self._entity_type(entity)
+        if refresh:  self.refresh(entity)
+        return self._table(entity).get(name)
+
+    def resolve(self, entity, name, refresh=False):
+        'Returns the id of the named entity, or None if not found.'
+        item = self.get(entity, name, refresh)
+        if item is not None:
+            return item.id
+
+    def refresh(self, entity=None):
+        'Drop the table of an entity type, or all, to be read again.'
+        if entity is None:  entities = self.entity_types.keys()
+        else:               entities = [self._entity_type(entity)]
+        self._lock.acquire()
+        try:
+            for entity in entities:
+                self._tables.pop(entity, None)
+                self._generations[entity] = (
+                    self._generations.get(entity, 0) + 1)
+        finally:
+            self._lock.release()
+        if self.cm.cache is not None:       # read from the server
+            for entity in entities:
+                self.cm.cache.invalidate(*self.entity_types[entity][:2])
+
+    def observe(self, service, functionname, args, kwargs, result):
+        'Update tables after a successful call, see _CMService._call().'
+        for entity, (servicename, listname, idarg, create, update, delete) in (
+            self.entity_types.items()):
+            if servicename != service or functionname not in (create, update,
+                delete):
+                continue                    # not a write of this type
+            self._lock.acquire()
+            try:
+                self._generations[entity] = (
+                    self._generations.get(entity, 0) + 1)
+                table = self._tables.get(entity)
+                if table is None:
+                    continue
+                itemid = _find_arg(idarg, args, kwargs)
+                if functionname == create and result and result[0].name:
+                    for item in result:
+                        table[item.name] = item
+                elif functionname == delete and itemid:
+                    itemid = str(itemid)
+                    for name, item in table.items():
+                        if str(item.id) == itemid:
+                            del table[name]
+                else:
+                    del self._tables[entity]    # can't tell, read again
+            finally:
+                self._lock.release()
+
+
+def _find_arg(name, args, kwargs):
+    'Returns the value of a named argument given as keyword or in a dict.'
+    if name in kwargs:
+        return kwargs[name]
+    for arg in args:
+        if isinstance(arg, TObj):   arg = arg.__get_dict__()
+        if isinstance(arg, dict) and name in arg:
+            return arg[name]
+
 
 class _CMService:
     '''
@@ -69,25 +637,99 @@ class _CMService:
                                 version used in the API docs (e.g. "PlayerRS").
         '''
         self.parent = parent
-        if servicename.endswith('RS'):      # remove it and lower first capital
-            self.service = servicename[0].lower() + servicename[1:-2]
-        else:
-            self.service = servicename
+        self.service = _service_name(servicename)
 
     def __getattr__(self, attr):
-        'Save function name, redirect attribute access to the method "call."'
-        self.functionname = attr
-        return self.call
-
-    def call(self, *args, **kwargs):
+        'Redirect attribute access to a callable bound to the function name.'
+        if attr.startswith('__'):           # leave python protocols alone
+            raise AttributeError, attr
+        function = _CMFunction(self, attr)
+        self.__dict__[attr] = function      # cache, next lookup skips this
+        return function
+
+    def _call(self, functionname, args, kwargs):
         '''
-            Calls the function (named by getattr) of this web service.
+            Calls the named function of this web service.
 
             Accepts dictionaries and/or TObjs as arguments or keyword arguments.
             Argument names and/or TObj sub-types can be set or overridden using
             the names given as keywords.
         '''
-        import httplib as http              # to use its constants
+        cache = self.parent.cache
+        if cache is None:
+            result = self._fetch(functionname, args, kwargs)
+        else:
+            result = cache.call(self.service, functionname, args, kwargs,
+                self._fetch)
+        if functionname.startswith(Resolver.write_prefixes):
+            self.parent.resolver.observe(self.service, functionname, args,
+                kwargs, result)
+        return result
+
+    def _fetch(self, functionname, args, kwargs):
+        'Calls the named function on the server, see _call().'
+        limit = self.parent.limit
+        if limit is not None:  limit.acquire()
+        try:
+            response = self._post(functionname, args, kwargs)
+        finally:
+            if limit is not None:  limit.release()
+        # print the response, if desired.  Formatting is skipped entirely,
+        # not just its output, unless debug logging is enabled.
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug('')
+            log.debug('Response: %s\n', response)
+
+        # handle response tuple (status, stat text, body, ctype) and any errors
+        status, reason, body, ctype = response
+        if status == http.OK:      # 200 OK we in business
+            if debug and body and ctype and ctype.startswith('text/xml'):
+                from xml.dom.minidom import parseString             # pprint
+                log.debug('{\n%s', parseString(body).toprettyxml(indent='    '))
+            response_list = soaplib.xml2list(body, self._roottag(functionname))
+            # Convert dicts to TObjs for return
+            tobj = self._response_type(functionname)
+            response_list = [ tobj(**adict) for adict in response_list ]
+            return response_list
+        self._raise_error(status, reason, body, ctype)
+
+    def _iter_call(self, functionname, args, kwargs):
+        '''
+            Calls the named function of this web service, like _call(), but
+            yields the returned TObjs one at a time, decoded incrementally as
+            the response arrives.  The request is sent on first iteration,
+            and counts against the ConManager's limit until the generator
+            is exhausted or closed.
+        '''
+        limit = self.parent.limit
+        if limit is not None:  limit.acquire()
+        try:
+            status, reason, body, ctype = self._post(functionname, args,
+                kwargs, stream=True)
+            try:
+                if status != http.OK:
+                    self._raise_error(status, reason, body.read(), ctype)
+                tobj = self._response_type(functionname)
+                for adict in soaplib.iterxml2list(body,
+                    self._roottag(functionname)):
+                    yield tobj(**adict)
+            finally:
+                body.close()                # no-op if read to the end
+        finally:
+            if limit is not None:  limit.release()
+
+    def _response_type(self, functionname):
+        'Returns the TObj class to build the results of a function with.'
+        return _response_types.get( (self.service, functionname), TObj )
+
+    def _roottag(self, functionname):
+        'Returns the etree tag enclosing the results of a function.'
+        return '{http://%s.api.cm.scala.com}%s%s' % (
+            self.parent.api_vers, functionname, 'Response') # etree ns
+
+    def _post(self, functionname, args, kwargs, stream=False):
+        'Convert arguments to a list of dictionaries and POST the SOAP call.'
         arglist = []                        # collect arguments here
         for arg in args:                    # std args
             if isinstance(arg, TObj):       # convert TObj to dictionary first
@@ -113,45 +755,29 @@ class _CMService:
                 else:
                     arglist.append( {kwname:item} )
 
-        log.info( '%s %s.%s%s' % (self.parent.api_vers, self.service,
-            self.functionname, tuple(arglist)) )
+        log.info('%s %s.%s%s', self.parent.api_vers, self.service,
+            functionname, tuple(arglist))
         try:        # POST query
-            response = soaplib.post(
+            return soaplib.post(
                 self.parent.baseurl + self.service,                 # url
-                function='%s:%s' % (self.parent.nspace, self.functionname),#func
+                function='%s:%s' % (self.parent.nspace, functionname), # func
                 xmlns=self.parent.namespace,                        # xmlns
                 soapargs=arglist,                                   # soapargs
                 authstr=self.parent.authstr,                        # authstr
                 addheaders=[],                                      #prvnt issue
+                pool=self.parent.pool,                              # keepalive
+                stream=stream,                                      # iterparse
+                idempotent=functionname.startswith(ResponseCache.read_prefixes),
                 debug=log.isEnabledFor(logging.DEBUG) ) # Don't create debug txt
                                                         # if it won't be used.
         except IOError, e:
             log.error('%s: %s', e.__class__.__name__, e)
             raise IOError, e
-        # print the response, if desired
-        log.debug('')
-        log.debug('Response: %s\n' % (response,))
 
-        try:   http.OK            # ensure compatibility with py 2.3
-        except AttributeError:
-            http.OK, http.INTERNAL_SERVER_ERROR, http.NOT_FOUND = 200, 500, 404
-
-        # handle response tuple (status, stat text, body, ctype) and any errors
-        status, reason, body, ctype = response
+    def _raise_error(self, status, reason, body, ctype):
+        'Log an unsuccessful response and raise the closest Python exception.'
         msgtext = ''
-        if status == http.OK:      # 200 OK we in business
-            if body and ctype and ctype.startswith('text/xml'):  # pprint
-                from xml.dom.minidom import parseString
-                log.debug('{\n%s' % parseString(body).toprettyxml(indent='    ') )
-            roottag = '{http://%s.api.cm.scala.com}%s%s' % (
-                self.parent.api_vers, self.functionname, 'Response') # etree ns
-            response_list = soaplib.xml2list(body, roottag)
-            # Convert dicts to TObjs for return
-            response_list = [ TObj(**adict) for adict in response_list ]
-            return response_list
-
-        # continue on only if response is not OK
-        elif status == http.INTERNAL_SERVER_ERROR:   # parse CM error msg
+        if status == http.INTERNAL_SERVER_ERROR:   # parse CM error msg
             roottag = '{http://schemas.xmlsoap.org/soap/envelope/}Fault' # etree shenanigans
             msg = soaplib.xml2dict(body, roottag)
             if msg and type(msg) == dict:
@@ -192,6 +818,42 @@ class _CMService:
             raise Exception, errstr
 
 
+class _CMFunction(object):
+    '''
+        A remote function of a web service, as returned by attribute access
+        on a service, e.g.: cm.PlayerRS.list.  Instances are immutable and
+        carry their own function name, so they may be shared between threads.
+    '''
+    __slots__ = ('service', 'functionname')
+
+    def __init__(self, service, functionname):
+        object.__setattr__(self, 'service', service)
+        object.__setattr__(self, 'functionname', functionname)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError, '%s is read-only.' % self.__class__.__name__
+
+    def __call__(self, *args, **kwargs):
+        'Calls the function, see _CMService._call().'
+        return self.service._call(self.functionname, args, kwargs)
+
+    def iter(self, *args, **kwargs):
+        '''
+            Calls the function, returning a generator of TObjs decoded while
+            the response streams in, rather than a list.  Peak memory stays
+            flat regardless of the number of results.
+
+            Example:
+                for media in cm.MediaRS.list.iter():
+                    print media.name
+        '''
+        return self.service._iter_call(self.functionname, args, kwargs)
+
+    def __repr__(self):
+        return '<%s %s.%s>' % (self.__class__.__name__, self.service.service,
+            self.functionname)
+
+
 class ConManager:
     '''
         A class used to define a connection to a Scala Content Manager using its
@@ -202,7 +864,7 @@ class ConManager:
         common tasks, such as uploading a file, or handling metadata.
     '''
     def __init__(self, baseurl, authstr, api_vers=_def_api_vers,
-        nspace=_def_namespace):
+        nspace=_def_namespace, pool=None, cache=None, limit=None):
         '''
             Arguments:
                 baseurl     - An URL describing the base address of the CM,
@@ -212,6 +874,15 @@ class ConManager:
             Options:
                 api_vers    - Specify which CM API version to use.
                 nspace      - Change SOAP namespace.
+                pool        - A soaplib.ConnectionPool to send requests through,
+                              by default the module-wide soaplib.default_pool.
+                              Its stats() method reports connection reuse.
+                cache       - A ResponseCache for read-only calls, or True
+                              for one with default settings.  Off by default.
+                limit       - Maximum number of calls in flight at once from
+                              all threads, however they were started, or a
+                              threading.Semaphore to share the cap with
+                              other ConManagers.  Unlimited by default.
         '''
         if baseurl.endswith('/'):   sep = ''
         else:                       sep = '/'
@@ -223,13 +894,165 @@ class ConManager:
         self.namespace = (
             'xmlns:%s="http://%s.api.cm.scala.com"' % (nspace, api_vers) )
         self.services = {}
+        self._services_lock = threading.Lock()
+        self._meta_index = {}               # service: {metadata name: id}
+        self._meta_lock = threading.Lock()
+        self.resolver = Resolver(self)
         self.debug = log.isEnabledFor(logging.DEBUG)
+        if pool is None:  pool = soaplib.default_pool
+        self.pool = pool
+        if cache is True:  cache = ResponseCache()
+        self.cache = cache
+        if isinstance(limit, (int, long)):
+            limit = threading.BoundedSemaphore(limit)
+        self.limit = limit
 
     def __getattr__(self, attr):
-        # cache service objects
-        if attr not in self.services:
-            self.services[attr] = _CMService(self, attr)   # create svc handler
-        return self.services[attr]
+        if attr.startswith('__'):           # leave python protocols alone
+            raise AttributeError, attr
+        # cache service objects, one per name even when threads race here
+        service = self.services.get(attr)
+        if service is None:
+            self._services_lock.acquire()
+            try:
+                service = self.services.get(attr)
+                if service is None:         # create svc handler
+                    service = self.services[attr] = _CMService(self, attr)
+            finally:
+                self._services_lock.release()
+        return service
+
+    def batch(self, calls, workers=_def_workers, raise_errors=False):
+        '''
+            Send a number of independent calls concurrently.
+
+            Arguments:
+                calls       - A list of call specifications, each a tuple of:
+                                (name,)
+                                (name, kwargs)
+                                (name, args, kwargs)
+                              where name is "service.function", e.g.
+                              "MediaRS.get", args a tuple and kwargs a dict.
+            Options:
+                workers     - Maximum number of calls in flight at once.
+                raise_errors - Raise the first failed call's exception once
+                               the whole batch has finished.
+            Returns:
+                A list with one entry per call in input order, holding the
+                list of TObjs the call returned, or the exception it raised.
+            Example:
+                results = cm.batch([
+                    ('PlayerRS.list',),
+                    ('ChannelRS.getFrames', dict(channelId=5)),
+                    ('ChannelRS.getTimeslots', ({'channelId':5},),
+                        dict(frameId=7)),
+                    ])
+        '''
+        specs = []
+        for call in calls:
+            if isinstance(call, basestring):    call = (call,)
+            name, args, kwargs = call[0], (), {}
+            if len(call) == 2:                  kwargs = call[1]
+            elif len(call) == 3:                args, kwargs = call[1:]
+            elif len(call) != 1:
+                raise TypeError, 'Invalid call specification: %r' % (call,)
+            try:
+                servicename, functionname = name.split('.')
+            except ValueError:
+                raise ValueError, 'Call name must be "service.function": %s' % (
+                    name,)
+            specs.append( (getattr(getattr(self, servicename), functionname),
+                tuple(args), dict(kwargs or {})) )
+
+        def run(spec):
+            function, args, kwargs = spec
+            return function(*args, **kwargs)
+
+        results = map_concurrent(run, specs, workers=workers)
+        if raise_errors:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+    def map(self, name, kwarglist, workers=_def_workers, raise_errors=False):
+        '''
+            Call one function concurrently with each of a list of keyword
+            argument dictionaries.  See batch() for options and return value.
+
+            Example:
+                medias = cm.map('MediaRS.get', [ dict(mediaId=i) for i in ids ])
+        '''
+        return self.batch([ (name, kwargs) for kwargs in kwarglist ],
+            workers=workers, raise_errors=raise_errors)
+
+    def iter_list(self, servicename, page_size=_def_page_size, prefetch=True,
+        function='list', **kwargs):
+        '''
+            Iterate over the results of a list function page by page, using
+            the offset and limit list options, so large inventories can be
+            walked without holding them in memory.  While one page is being
+            consumed the next is fetched in the background.
+
+            Arguments:
+                servicename     - The service to list, e.g. "MediaRS".
+            Options:
+                page_size       - Number of items requested per call.
+                prefetch        - Fetch the next page in the background.
+                function        - Name of the list function to call.
+                kwargs          - Further arguments to the list function,
+                                  e.g. searchCriteria.
+            Example:
+                src = scws.TObj(column='name', restriction='LIKE', value='%.png')
+                for media in cm.iter_list('MediaRS', searchCriteria=src):
+                    print media.name
+        '''
+        listfunc = getattr(getattr(self, servicename), function)
+        def fetch(offset):
+            options = dict(offset=offset, limit=page_size)
+            return listfunc(listOptions=options, **kwargs)
+
+        offset = 0
+        first = None
+        page = fetch(offset)
+        while page:
+            if len(page) > page_size:       # server ignored the list options
+                log.warn('%s.%s does not support paging.', servicename,
+                    function)
+                prefetch = False
+            elif first is not None and page[0].__get_dict__() == first:
+                log.warn('%s.%s returned the same page twice, stopping.',
+                    servicename, function)
+                return
+            first = page[0].__get_dict__()
+
+            more = len(page) == page_size
+            offset += page_size
+            if more and prefetch:           # overlap next call with caller
+                pending = _Future(fetch, offset)
+            for item in page:
+                yield item
+            if not more:
+                return
+            if prefetch:    page = pending.result()
+            else:           page = fetch(offset)
+
+    def resolve(self, entity, name, refresh=False):
+        '''
+            Returns the id of an entity found by name, or None.  All names of
+            a type are read with one list call on first use, see Resolver.
+
+            Arguments:
+                entity      - Type of entity, one of: channel, frameset,
+                              media, message, player, playergroup, playlist,
+                              template.
+                name        - Its name.
+            Options:
+                refresh     - Read the names of this type again first.
+            Example:
+                channelId = cm.resolve('channel', 'Lobby')
+        '''
+        return self.resolver.resolve(entity, name, refresh)
 
     def get_metaval(self, item, name):
         '''
@@ -316,7 +1139,7 @@ class ConManager:
             items = service.list(searchCriteria=src)
             if items:   item = items[0].id
             else:
-                log.error('Item "%s" not found.' % item)
+                log.error('Item "%s" not found.', item)
                 return None
         elif type(item) is int:  pass
         else:
@@ -327,7 +1150,7 @@ class ConManager:
         mlist = service.listMeta(searchCriteria=src)
         if mlist:   metadataid = mlist[0].id
         else:
-            log.error('Metadata named: "%s" not found.' % name)
+            log.error('Metadata named: "%s" not found.', name)
             return None
 
         # find the value with the matching metadata name id, else None
@@ -345,8 +1168,204 @@ class ConManager:
         if result:  return result[0].value
         else:       return None
 
+    def get_metavals(self, items, names, workers=_def_workers,
+        raise_errors=False):
+        '''
+            Read several metadata values of several items at once.
+
+            Metadata names are resolved from an index of the service's
+            metadata definitions, fetched once and kept.  Item names are
+            resolved with a single pass over the service's list, and the
+            values of all items are fetched concurrently.
+
+            Arguments:
+                items       - A list of names/integer ids of media items or
+                              players.
+                names       - A list of metadata names, all starting with
+                              either "MediaItem." or "Player.".
+            Options:
+                workers     - Maximum number of calls in flight at once.
+                raise_errors - Raise the first failed call's exception,
+                               otherwise it takes the place of the item's row.
+            Returns:
+                A table with one row per item and one column per name, in
+                the order given.  Values of unknown items or metadata names,
+                and those not set, are None.
+            Example:
+                names = ['Player.postalcode', 'Player.city']
+                table = cm.get_metavals(playerids, names)
+                for playerid, row in zip(playerids, table):
+                    print playerid, row
+        '''
+        service, idparam = self._meta_service(names)
+        metadataids = self._metadata_ids(service, names)
+        itemids = self._item_ids(service, items)
+
+        wanted = [ itemid for itemid in itemids if itemid is not None ]
+        results = self.map(service.service + '.getMetaValues',
+            [ {idparam:itemid} for itemid in wanted ], workers=workers,
+            raise_errors=raise_errors)
+        byitem = dict(zip(wanted, results))
+
+        table = []
+        for itemid in itemids:
+            values = byitem.get(itemid)
+            if isinstance(values, Exception):
+                table.append(values)
+                continue
+            found = {}
+            for metavalue in values or ():
+                found[str(metavalue.metadataId)] = metavalue.value
+            table.append([ found.get(metadataids.get(name)) for name in names ])
+        return table
+
+    def set_metavals(self, values, workers=_def_workers, raise_errors=False):
+        '''
+            Set several metadata values on several items at once, with
+            calls for different items sent concurrently.  See get_metavals()
+            for how names are resolved.
+
+            Arguments:
+                values      - A dictionary of {item: {name: value}}, items
+                              given as name or integer id, metadata names all
+                              starting with either "MediaItem." or "Player.".
+            Options:
+                workers     - Maximum number of items updated at once.
+                raise_errors - Raise the first exception encountered,
+                               otherwise it takes the place of the item's
+                               results.
+            Returns:
+                A dictionary of {item: {name: value}}, holding the values
+                returned by the server, or None for unknown items/names.
+            Example:
+                cm.set_metavals({ 346734: {'Player.postalcode': 91367},
+                    'Lobby': {'Player.postalcode': 19341} })
+        '''
+        items = values.keys()
+        names = {}
+        for namevals in values.values():
+            names.update(dict.fromkeys(namevals))
+        service, idparam = self._meta_service(names.keys())
+        metadataids = self._metadata_ids(service, names.keys())
+        itemids = dict(zip(items, self._item_ids(service, items)))
+
+        def update(item):
+            result = dict.fromkeys(values[item])
+            itemid = itemids[item]
+            if itemid is None:
+                return result
+            params = {idparam:itemid}
+            existing = {}
+            for metavalue in service.getMetaValues(**params):
+                existing[str(metavalue.metadataId)] = metavalue.id
+            for name, value in values[item].items():
+                metadataid = metadataids.get(name)
+                if metadataid is None:
+                    continue
+                if metadataid in existing:
+                    service.deleteMetaValue(metaValueId=existing[metadataid])
+                mvto = TObj(metadataId=metadataid, value=value)
+                added = service.addMetaValue(params, value=mvto)
+                if added:  result[name] = added[0].value
+            return result
+
+        results = map_concurrent(update, items, workers=workers)
+        if raise_errors:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return dict(zip(items, results))
+
+    def _meta_service(self, names):
+        'Returns the (service, id parameter name) that metadata names are in.'
+        prefixes = {}
+        for name in names:
+            if not type(name) in (str, unicode):
+                raise TypeError, 'name must be string.'
+            prefixes[name.split('.', 1)[0]] = name
+        if len(prefixes) > 1:
+            raise ValueError, 'Metadata names must all be of one type: %s' % (
+                ', '.join(prefixes.values()))
+        if prefixes.keys() == ['MediaItem']:  return self.media, 'mediaId'
+        elif prefixes.keys() == ['Player']:   return self.player, 'playerId'
+        raise ValueError, 'Metadata type: "%s" unknown.' % (
+            ', '.join(prefixes.values()))
+
+    def _metadata_ids(self, service, names):
+        '''
+            Returns a dictionary of the metadata ids of names, from an index
+            of all metadata definitions of the service, read once and again
+            when a name is not found in it.
+        '''
+        servicename = service.service
+        for attempt in (0, 1):
+            self._meta_lock.acquire()
+            try:
+                index = self._meta_index.get(servicename)
+                if index is None:
+                    index = {}
+                    for metadata in service.listMeta():
+                        index[metadata.name] = str(metadata.id)
+                    self._meta_index[servicename] = index
+                    attempt = 1             # just read, no need to re-read
+            finally:
+                self._meta_lock.release()
+
+            missing = [ name for name in names if name not in index ]
+            if not missing or attempt:
+                break
+            log.debug('metadata not in index, re-reading: %s', missing)
+            self._meta_lock.acquire()
+            try:
+                if self._meta_index.get(servicename) is index:
+                    del self._meta_index[servicename]
+            finally:
+                self._meta_lock.release()
+
+        for name in missing:
+            log.warn('Metadata named: "%s" not found.', name)
+        return dict([ (name, index[name]) for name in names if name in index ])
+
+    def _item_ids(self, service, items):
+        '''
+            Returns a list of the ids of media items or players given by name
+            or id, None for names not found.  Names are looked up in one pass
+            over the service's list.
+        '''
+        names = {}
+        for item in items:
+            if type(item) in (str, unicode) and not item.isdigit():
+                names[item] = None
+            elif not isinstance(item, (int, long, basestring)):
+                raise TypeError, 'item must be a string or integer id.'
+
+        if len(names) == 1:
+            src = TObj(column='name', restriction='EQUALS',
+                value=names.keys()[0])
+            for found in service.list(searchCriteria=src)[:1]:
+                names[found.name] = found.id
+        elif names:
+            remaining = len(names)
+            for found in self.iter_list(service.service):
+                if names.get(found.name, 0) is None:
+                    names[found.name] = found.id
+                    remaining -= 1
+                    if not remaining:  break
+
+        result = []
+        for item in items:
+            if item in names:
+                if names[item] is None:
+                    log.warn('Item "%s" not found.', item)
+                result.append(names[item])
+            else:
+                result.append(item)
+        return result
+
     def upload_file(self, filenames, network, chunked=True, subfolder='',
-        upload_method='PUT', upload_type='auto'):
+        upload_method='PUT', upload_type='auto', workers=1, max_rate=None,
+        raise_errors=True, manifest=None, verify=False,
+        hash_workers=_def_hash_workers):
         '''
             Convenience function to upload files to this Content Manager.
 
@@ -361,96 +1380,204 @@ class ConManager:
                 upload_type         - Upload type, e.g. media|maintenance|auto
                 chunked             - Enable chunked transfer encoding on larger
                                       files.
+                workers             - Number of files to upload at once.  The
+                                      request, transfer and registration of
+                                      one file overlap with those of others.
+                max_rate            - Cap on the combined upload rate of all
+                                      files in bytes per second, or a
+                                      soaplib.RateLimiter to share the cap
+                                      with other uploads.  Default:
+                                      soaplib.default_limiter, if set.
+                raise_errors        - Raise the first error encountered.  If
+                                      false, the exception takes the place of
+                                      the id of each file that failed.
+                manifest            - An UploadManifest or its filename.
+                                      Files whose content was already
+                                      uploaded to the same network and path
+                                      are skipped, their recorded id is
+                                      returned.  So are files whose content
+                                      is there under another name or
+                                      folder, if that media item still
+                                      exists with the same size.
+                verify              - With manifest, also check that the
+                                      recorded media item still exists on
+                                      the CM with the same size.
+                hash_workers        - Number of files hashed at once, ahead
+                                      of their upload.
             Returns
-                mediaIds            - List of MediaItem id numbers of the files.
+                mediaIds            - List of MediaItem id numbers of the files,
+                                      in the order given.
                                       If not found available, returns the file
                                       upload id instead.
             Example:
                 # See the cm_upload.py script for a general solution.
                 fileId = cm.upload_file('pow123.png', 'SCALA_CUSTOMER')[0]
+                fileIds = cm.upload_file(names, 'SCALA_CUSTOMER', workers=4,
+                    max_rate=2*1024*1024, raise_errors=False)
+                fileIds = cm.upload_file(names, 'SCALA_CUSTOMER',
+                    manifest='uploads.json')     # only new or changed files
         '''
         if type(filenames) is not list: filenames = [filenames]
-        fileIds = []
-        for filename in filenames:
-            if not os.access(filename, os.R_OK):
-                errstr = 'File "%s" cannot be accessed.' % filename
-                log.error(errstr)
-                raise IOError, errstr
+        limiter = max_rate
+        if max_rate and not isinstance(max_rate, soaplib.RateLimiter):
+            limiter = soaplib.RateLimiter(max_rate)
+        digests = None
+        if manifest is not None:
+            if not isinstance(manifest, UploadManifest):
+                manifest = UploadManifest(manifest)
+            digests = _DigestPool(filenames, workers=hash_workers)
+
+        def upload(index):
+            digest = None
+            if digests:  digest = digests.get(index)
+            return self._upload_one(filenames[index], network, chunked,
+                subfolder, upload_method, upload_type, limiter, manifest,
+                digest, verify)
+
+        try:
+            if workers <= 1 and raise_errors:   # stop at the first error
+                return [ upload(index) for index in range(len(filenames)) ]
+
+            fileIds = map_concurrent(upload, range(len(filenames)),
+                workers=workers)
+        finally:
+            if manifest is not None:
+                manifest.save()
+        if raise_errors:
+            for result in fileIds:
+                if isinstance(result, Exception):
+                    raise result
+        return fileIds
+
+    def _upload_one(self, filename, network, chunked, subfolder,
+        upload_method, upload_type, limiter=None, manifest=None, digest=None,
+        verify=False):
+        'Upload a single file, see upload_file().  Returns its id.'
+        if not os.access(filename, os.R_OK):
+            errstr = 'File "%s" cannot be accessed.' % filename
+            log.error(errstr)
+            raise IOError, errstr
+
+        log.info('filename: "%s"', filename)
+        basename = os.path.basename(filename)
+        # decide on a file type
+        if upload_type.lower() == 'auto':
+            if os.path.splitext(basename)[1].lower() in ['.bat', '.cmd',
+                '.py', '.vbs', '.exe']:
+                                    upload_type = 'MAINTENANCE'
+            else:                   upload_type = 'MEDIA'
+        else:  upload_type = upload_type.upper()
+
+        # Request an upload
+        # -----------------------------------------------------------
+        path = '/content'
+        if subfolder: path = '%s/%s' % (path, subfolder)
+        destpath = '%s/%s' % (path, basename)
+        if digest:  # skip unchanged content
+            mediaId = manifest.lookup(digest, network, destpath)
+            if mediaId and verify and not self._media_matches(mediaId,
+                os.path.getsize(filename)):
+                log.info('id#:%s changed on the CM, uploading again.', mediaId)
+                manifest.forget(digest, network, destpath)
+                mediaId = None
+            if mediaId:
+                log.info('unchanged, as id#:%s', mediaId)
+                return mediaId
+            found = manifest.find(digest, network)
+            if found and self._media_matches(found[1],
+                os.path.getsize(filename)):     # same content, other name
+                log.info('same as %s, as id#:%s', found[0], found[1])
+                manifest.record(digest, network, destpath, found[1])
+                return found[1]
+            elif found:
+                manifest.forget(digest, network, found[0])
+
+        robj = TObj(filename=basename,
+            type=upload_type, path=path, size=os.path.getsize(filename))
+        try:  # One error here, we should quit
+            uploadTO = self.uploadfile.requestUpload(arg0=robj)[0]
+        except Exception, e:
+            log.error(str(e))
+            raise type(e), e
+
+        fileId = uploadTO.mediaItemId or uploadTO.fileId # new attribute
+        uploadAs = uploadTO.uploadAsFilename
+        log.debug('as id#:%s - %s,', fileId, uploadAs)
+
+        # Now, upload file
+        # -----------------------------------------------------------
+        if upload_method == 'POST':
+            posturl = self.baseurl_orig + 'servlet/uploadFile'
+            try:
+                response = soaplib.post(posturl, filename=basename,
+                    addheaders=[ ('filenameWithPath',
+                    '%s%s/%s' % (network, path, uploadAs) ) ],
+                    authstr=self.authstr, debug=self.debug,
+                    pool=self.pool)
+            except Exception, e:
+                log.error('%s: %s', type(e), e)
+                raise e
+
+            if response[0] == http.OK:
+                log.debug('Uploaded.')
             else:
-                log.info('filename: "%s"' % filename )
-                basename = os.path.basename(filename)
-                # decide on a file type
-                if upload_type.lower() == 'auto':
-                    if os.path.splitext(basename)[1].lower() in ['.bat', '.cmd',
-                        '.py', '.vbs', '.exe']:
-                                            upload_type = 'MAINTENANCE'
-                    else:                   upload_type = 'MEDIA'
-                else:  upload_type = upload_type.upper()
-
-                # Request an upload
-                # -----------------------------------------------------------
-                path = '/content'
-                if subfolder: path = '%s/%s' % (path, subfolder)
-                robj = TObj(filename=basename,
-                    type=upload_type, path=path, size=os.path.getsize(filename))
-                try:  # One error here, we should quit
-                    uploadTO = self.uploadfile.requestUpload(arg0=robj)[0]
+                errstr = 'file not uploaded: %s %s' % (
+                    response[0], response[1])
+                log.error(errstr)
+                raise Exception, errstr
+
+        elif upload_method.startswith('PUT'):
+            desturl = '%sdata/webdav/%s%s/%s' % (
+                self.baseurl_orig, network, path, uploadAs)
+            try:  # response is a tuple (code, abstract, document)
+                response = soaplib.put(filename, desturl,
+                    authstr=self.authstr, chunked=chunked,
+                    debug=self.debug, pool=self.pool, limiter=limiter)
+            except Exception, e:
+                log.error(str(e))
+                raise e
+
+            if response[0] == http.CREATED:  # 201
+                try:  # Notify the server that upload is finished
+                    self.uploadfile.uploadFinished(arg0=uploadTO.fileId)
                 except Exception, e:
                     log.error(str(e))
-                    raise type(e), e
-
-                fileId = uploadTO.mediaItemId or uploadTO.fileId # new attribute
-                uploadAs = uploadTO.uploadAsFilename
-                log.debug('as id#:%s - %s,' % (fileId, uploadAs))
-
-                # Now, upload file
-                # -----------------------------------------------------------
-                import httplib as http  # use constants
-                if upload_method == 'POST':
-                    posturl = self.baseurl_orig + 'servlet/uploadFile'
-                    try:
-                        response = soaplib.post(posturl, filename=basename,
-                            addheaders=[ ('filenameWithPath',
-                            '%s%s/%s' % (network, path, uploadAs) ) ],
-                            authstr=self.authstr, debug=self.debug)
-                    except Exception, e:
-                        log.error('%s: %s' % (type(e), e) )
-                        raise e
-
-                    if response[0] == http.OK:
-                        log.debug('Uploaded.')
-                    else:
-                        errstr = 'file not uploaded: %s %s' % (
-                            response[0], response[1])
-                        log.error(errstr)
-                        raise Exception, errstr
-
-                elif upload_method.startswith('PUT'):
-                    desturl = '%sdata/webdav/%s%s/%s' % (
-                        self.baseurl_orig, network, path, uploadAs)
-                    try:  # response is a tuple (code, abstract, document)
-                        response = soaplib.put(filename, desturl,
-                            authstr=self.authstr, chunked=chunked, debug=self.debug)
-                    except Exception, e:
-                        log.error(str(e))
-                        raise e
-
-                    if response[0] == http.CREATED:  # 201
-                        try:  # Notify the server that upload is finished
-                            self.uploadfile.uploadFinished(arg0=uploadTO.fileId)
-                        except Exception, e:
-                            log.error(str(e))
-                            raise e
-                        log.debug('Registered.')
-                    else:
-                        errstr = 'file not uploaded: %s %s' % (
-                            response[0], response[1])
-                        log.error(errstr)
-                        raise Exception, errstr
-
-                log.info('Done.')
-                fileIds.append(fileId)
-        return fileIds
+                    raise e
+                log.debug('Registered.')
+                if self.cache is not None:  # a new media item
+                    self.cache.invalidate('media')
+                self.resolver.refresh('media')
+            else:
+                errstr = 'file not uploaded: %s %s' % (
+                    response[0], response[1])
+                log.error(errstr)
+                raise Exception, errstr
+
+        if digest:
+            manifest.record(digest, network, destpath, fileId)
+        log.info('Done.')
+        return fileId
+
+    def _media_matches(self, mediaId, size):
+        'Whether a media item exists on the CM with the given file size.'
+        try:
+            media = self.media.get(mediaId=mediaId)
+        except Exception, e:        # e.g. deleted since
+            log.debug('media.get(%s): %s', mediaId, e)
+            return False
+        if not media:  return False
+        return str(media[0].length) == str(size)
+
+
+def _copy_value(value):
+    'Returns a deep copy of a decoded value: TObjs, lists, dicts and strings.'
+    if isinstance(value, TObj):
+        return value._copy()
+    elif type(value) is list:
+        return [ _copy_value(item) for item in value ]
+    elif type(value) is dict:
+        return dict([ (key, _copy_value(val)) for key, val in value.items() ])
+    return value                            # strings are immutable
 
 
 class TObj(object):
@@ -487,7 +1614,7 @@ class TObj(object):
         else:        self._typestr = ''
         for key,val in kwargs.items():
             setattr(self, key, val)
-        log.debug('TObj created with: %s' % self.__dict__)
+        log.debug('TObj created with: %s', self.__dict__)
 
     def __str__(self):
         result = '%s{\n' % (self._typestr or self.__class__)
@@ -505,6 +1632,12 @@ class TObj(object):
     def __getattr__(self, attr):  # override to get None instead of attr error
         return self.__dict__.get(attr)
 
+    def _copy(self):
+        'Returns a deep copy of this object.'
+        result = self.__class__.__new__(self.__class__)
+        result.__dict__.update(_copy_value(self.__dict__))
+        return result
+
     def __get_dict__(self, wrap=False, includetype=False):
         '''
             Returns a dictionary copy of this object, minus keys starting with
@@ -542,5 +1675,216 @@ class TObj(object):
         return self.__get_dict__(includetype=False).iterkeys()
 
 
-tobj = TObj     # Make a lowercase name available as well.
+class _TypedTObj(TObj):
+    '''
+        Base of the compact transfer object types below.  The fields of the
+        CM type are stored in __slots__ rather than an instance dictionary,
+        saving memory and time when many thousands are held.  Behavior
+        matches TObj: missing fields read as None and attributes not among
+        the fields may still be set, they are kept in a separate dictionary.
+        __dict__ returns a copy of the attributes, as it can't be written
+        through.
+    '''
+    __slots__ = ('_typestr', '_extra', '_isset')
+    _fields = ()
+    _bits = {'_typestr':0}          # field name: bit in _isset
+    _getters = ()                   # (name, bit, slot getter) per field
+    _setters = {}                   # name: (bit, slot setter) per field
 
+    def __init__(self, *typestr, **kwargs):
+        # built for every item of every response: slots are set through
+        # their descriptors, and unlike TObj there is no debug message per
+        # object, the response is logged whole before decoding
+        if typestr:  _set_typestr(self, str(typestr[0]))
+        else:        _set_typestr(self, '')
+        _set_extra(self, None)
+        setters = self._setters
+        isset = 0
+        for key, val in kwargs.iteritems():
+            try:
+                bit, setter = setters[key]
+            except KeyError:                # not a field of this type
+                self.__setattr__(key, val)
+                continue
+            setter(self, val)
+            isset |= bit
+        _set_isset(self, isset)
+
+    def __setattr__(self, attr, value):
+        bit = self._bits.get(attr)
+        if bit is not None:
+            object.__setattr__(self, attr, value)
+            object.__setattr__(self, '_isset', self._isset | bit)
+        else:
+            if self._extra is None:
+                object.__setattr__(self, '_extra', {})
+            self._extra[attr] = value
+
+    def __delattr__(self, attr):
+        bit = self._bits.get(attr)
+        if bit:
+            object.__delattr__(self, attr)
+            object.__setattr__(self, '_isset', self._isset & ~bit)
+        elif self._extra and attr in self._extra:
+            del self._extra[attr]
+        else:
+            raise AttributeError, attr
+
+    def __getattr__(self, attr):    # an unset field or unknown attribute
+        if attr.startswith('__'):   # leave python protocols alone
+            raise AttributeError, attr
+        if self._extra:
+            return self._extra.get(attr)
+        return None
+
+    @property
+    def __dict__(self):
+        '''
+            The attributes of this object as TObj.__dict__ has them, fields
+            set and others.  A new dictionary: changes to it are not kept,
+            set attributes on the object instead.
+        '''
+        result = self.__get_dict__(includetype=True)
+        if self._extra:
+            result.update(self._extra)
+        return result
+
+    def _copy(self):
+        'Returns a deep copy of this object.'
+        setslot = object.__setattr__
+        result = self.__class__.__new__(self.__class__)
+        setslot(result, '_typestr', self._typestr)
+        setslot(result, '_extra', self._extra and _copy_value(self._extra))
+        isset = self._isset
+        setslot(result, '_isset', isset)
+        for key, bit, get in self._getters:
+            if isset & bit:
+                setslot(result, key, _copy_value(get(self)))
+        return result
+
+    def __get_dict__(self, wrap=False, includetype=False):
+        '''
+            Returns a dictionary copy of this object, minus keys starting with
+            the underscore character.  See TObj.__get_dict__().
+        '''
+        result = {}
+        if includetype:
+            result['_typestr'] = self._typestr
+        isset = self._isset
+        for key, bit, get in self._getters:
+            if isset & bit:
+                result[key] = get(self)
+        if self._extra:
+            for key, val in self._extra.iteritems():
+                if not key.startswith('_'):
+                    result[key] = val
+
+        if wrap:  # wrap with name arg
+            result = { self._typestr:result }
+        return result
+
+    def __contains__(self, item):
+        'Implement "in" tests, e.g.: if "key" in TObj(): pass'
+        bit = self._bits.get(item)
+        if bit is not None:
+            return bool(self._isset & bit) or item == '_typestr'
+        return bool(self._extra) and item in self._extra
+
+    def __nonzero__(self):
+        'Implement truth tests, e.g.: if not TObj(): pass'
+        return True                 # as TObj, _typestr is always present
+
+
+_set_typestr = _TypedTObj.__dict__['_typestr'].__set__
+_set_extra = _TypedTObj.__dict__['_extra'].__set__
+_set_isset = _TypedTObj.__dict__['_isset'].__set__
+
+
+def _transfer_type(name, fields):
+    '''
+        Generate a _TypedTObj subclass for a CM transfer object type.
+
+        Arguments:
+            name        - Name of the type, as in the API docs.
+            fields      - Whitespace separated field names.
+    '''
+    fields = tuple(fields.split())
+    bits = dict([ (field, 1 << i) for i, field in enumerate(fields) ])
+    bits['_typestr'] = 0
+    cls = type(name, (_TypedTObj,), dict(
+        __slots__=fields,
+        __doc__='Compact TObj for the CM %s type, see _TypedTObj.' % name,
+        _fields=fields,
+        _bits=bits,
+        ))
+    cls._getters = tuple([ (field, bits[field], getattr(cls, field).__get__)
+        for field in fields ])
+    cls._setters = dict([ (field, (bits[field], getattr(cls, field).__set__))
+        for field in bits ])
+    return cls
+
+
+ChannelTO = _transfer_type('ChannelTO', '''id name description framesetId
+    playDedicatedAudioTrack audioControlledByAdManager muteAudioFromVisual
+    variant triggersSupported lastModified''')
+FrameTO = _transfer_type('FrameTO', '''id name x y width height sortOrder
+    autoscale audioTrack hidden color framesetId''')
+FramesetTO = _transfer_type('FramesetTO', '''id name screenWidth screenHeight
+    lastModified''')
+MediaTO = _transfer_type('MediaTO', '''id name description path mediaType
+    length width height duration revision status approvalStatus uploadType
+    validDateFrom validDateTo startValidDate endValidDate lastModified
+    createdDate createdBy modifiedBy prettifyDuration prettifyLength
+    thumbnailDownloadPaths webDavPath downloadPath messagesCount
+    playlistsCount templateId''')
+MetadataTO = _transfer_type('MetadataTO', '''id name type valueType
+    allowedValues order''')
+MetaValueTO = _transfer_type('MetaValueTO', '''id metadataId value''')
+PlayerTO = _transfer_type('PlayerTO', '''id name description type enabled
+    active uuid previewPlayer requestLogs downloadThreads unusedFilesCache
+    planDeliveryMethod pollingInterval pollingUnit logLevel timezoneOffset
+    distributionServerId distributionServerName playerDisplays lastModified
+    numberOfDisplays''')
+PlayerDisplayTO = _transfer_type('PlayerDisplayTO', '''id name description
+    channelId channelName screenCounter playerId''')
+PlaylistTO = _transfer_type('PlaylistTO', '''id name description
+    playlistType healthy duration prettifyDuration itemCount lastModified
+    createdDate createdBy modifiedBy''')
+PlaylistItemTO = _transfer_type('PlaylistItemTO', '''id name playlistId
+    mediaId playlistItemType duration prettifyDuration sortOrder
+    useValidRange startValidDate endValidDate inPoint outPoint
+    conditionsActive disabled''')
+TimeslotTO = _transfer_type('TimeslotTO', '''id name channelId frameId
+    playlistId startDate endDate startTime endTime recurrencePattern weekdays
+    monthPeriod recurrenceDayOfMonth recurrenceDayOfWeek
+    recurrenceWeekOfMonth playFullScreen color locked sortOrder
+    priorityClass alternateType''')
+UploadFileTO = _transfer_type('UploadFileTO', '''fileId mediaItemId
+    uploadAsFilename''')
+
+# Types of the items returned by the most common calls, keyed on
+# (service, function).  Anything else is returned as a plain TObj.
+_response_types = {}
+for _funcs, _tobj in [
+    ('channel.get channel.list channel.create channel.update', ChannelTO),
+    ('channel.getFrames channel.createFrame', FrameTO),
+    ('channel.getFrameset channel.listFramesets channel.createFrameset',
+        FramesetTO),
+    ('channel.getTimeslots channel.createTimeslot', TimeslotTO),
+    ('media.get media.list media.update', MediaTO),
+    ('media.listMeta player.listMeta media.createMeta player.createMeta',
+        MetadataTO),
+    ('media.getMetaValues player.getMetaValues media.addMetaValue '
+        'player.addMetaValue', MetaValueTO),
+    ('player.get player.list player.create player.update', PlayerTO),
+    ('player.getPlayerDisplays', PlayerDisplayTO),
+    ('playlist.get playlist.list playlist.create playlist.update',
+        PlaylistTO),
+    ('playlist.getPlaylistItems playlist.addPlaylistItem', PlaylistItemTO),
+    ('uploadfile.requestUpload', UploadFileTO),
+    ]:
+    for _func in _funcs.split():
+        _response_types[tuple(_func.split('.'))] = _tobj
+del _funcs, _tobj, _func
+
+tobj = TObj     # Make a lowercase name available as well.
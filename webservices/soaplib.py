@@ -6,7 +6,11 @@
         - Used httplib for historical reasons; upgrade to urllib2
 '''
 if True:  # set up
-    import os, sys
+    import os, sys, time, select, socket, threading
+    try:                import mmap
+    except ImportError: mmap = None
+    try:                memoryview
+    except NameError:   memoryview = None   # Python 2.6
     import httplib, base64, urllib, urlparse
     import logging
     try:
@@ -15,9 +19,16 @@ if True:  # set up
     except ImportError:
         sl = st = None
 
-    __version__ = '1.15'
-    __all__ = ['dict2xml', 'get', 'put', 'post', 'xml2list', 'xml2dict']
+    __version__ = '1.22'
+    __all__ = ['dict2xml', 'get', 'put', 'post', 'soap_body', 'xml2list',
+        'xml2dict', 'iterxml2list', 'ConnectionPool', 'RateLimiter',
+        'StreamedResponse', 'default_limiter', 'default_pool']
     chunked_limit = 16384
+    def_chunk_size = 262144     # bytes per send, and chunk, in put()
+    def_pool_size = 8           # idle keep-alive connections kept per host
+    def_idle_timeout = 30       # seconds before an idle connection is dropped
+    _envelopes = {}             # (function, xmlns): SOAP envelope parts
+    _https_types = getattr(httplib, 'HTTPSConnection', ())  # () without ssl
     usr_agnt = 'Python/%s httplib' % sys.version.split()[0]
     soap_envelope = u'''<?xml version="1.0" encoding="utf-8"?>
     <soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
@@ -35,6 +46,264 @@ if True:  # set up
 
 
 
+# Classes
+# ---------------------------------------------------------------------
+class ConnectionPool(object):
+    '''
+        A per-host pool of persistent (keep-alive) HTTP/1.1 connections.
+
+        Connections are checked out for the length of one request/response
+        and handed back afterwards, so a pool may be shared between threads.
+        Idle connections that have been closed by the server or have sat
+        unused longer than idle_timeout are discarded rather than reused.
+
+        Example:
+            soaplib.default_pool = soaplib.ConnectionPool(maxsize=8,
+                idle_timeout=60)
+            ...
+            print soaplib.default_pool.stats()
+    '''
+    def __init__(self, maxsize=def_pool_size, idle_timeout=def_idle_timeout,
+        timeout=None):
+        '''
+            Options:
+                maxsize         - Number of idle connections to keep per host.
+                                  Zero disables keep-alive.
+                idle_timeout    - Seconds an idle connection may be kept.
+                timeout         - Socket timeout for new connections.
+        '''
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = {}                 # (proto, host): [(conn, since), ...]
+        self._lock = threading.Lock()
+        self._stats = dict(created=0, reused=0, stale=0, expired=0,
+            retried=0, closed=0)
+
+    def _count(self, name):
+        self._lock.acquire()
+        try:        self._stats[name] += 1
+        finally:    self._lock.release()
+
+    def _connect(self, proto, host):
+        'Open a new connection, sockets are connected lazily by httplib.'
+        if proto.endswith('s'):     cls = httplib.HTTPSConnection
+        else:                       cls = httplib.HTTPConnection
+        if self.timeout is None:    conn = cls(host)
+        else:                       conn = cls(host, timeout=self.timeout)
+        self._count('created')
+        return conn
+
+    def _is_stale(self, conn):
+        'An idle socket that is readable has been closed (or is confused).'
+        if conn.sock is None:
+            return True
+        try:
+            readable = select.select([conn.sock], [], [], 0)[0]
+        except (select.error, socket.error, ValueError):
+            return True
+        return bool(readable)
+
+    def acquire(self, proto, host):
+        '''
+            Returns a tuple of (connection, reused), reusing an idle
+            connection to proto://host when a healthy one is available.
+        '''
+        key = (proto, host)
+        now = time.time()
+        while True:
+            self._lock.acquire()
+            try:
+                idle = self._idle.get(key)
+                if idle:    conn, since = idle.pop()
+                else:       conn = None
+            finally:
+                self._lock.release()
+
+            if conn is None:
+                return self._connect(proto, host), False
+            if now - since > self.idle_timeout:
+                self._count('expired')
+            elif self._is_stale(conn):
+                self._count('stale')
+            else:
+                self._count('reused')
+                return conn, True
+            conn.close()
+
+    def release(self, proto, host, conn, reusable=True):
+        'Return a connection to the pool, or close it if it is unusable.'
+        if reusable and self.maxsize > 0 and conn.sock is not None:
+            key = (proto, host)
+            self._lock.acquire()
+            try:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.maxsize:
+                    idle.append( (conn, time.time()) )
+                    return
+            finally:
+                self._lock.release()
+        conn.close()
+        self._count('closed')
+
+    def clear(self):
+        'Close all idle connections.'
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for conns in idle.values():
+            for conn, since in conns:
+                conn.close()
+
+    def stats(self):
+        '''
+            Returns a dictionary of connection counters:
+                created, reused, stale, expired, retried, closed, idle
+            and reuse_ratio, the fraction of requests served by a kept-alive
+            connection.
+        '''
+        self._lock.acquire()
+        try:
+            result = dict(self._stats)
+            result['idle'] = sum([ len(c) for c in self._idle.values() ])
+        finally:
+            self._lock.release()
+        total = result['created'] + result['reused']
+        if total:   result['reuse_ratio'] = float(result['reused']) / total
+        else:       result['reuse_ratio'] = 0.0
+        return result
+
+default_pool = ConnectionPool()     # shared by get, put and post
+
+
+class RateLimiter(object):
+    '''
+        A token bucket limiting the combined rate of transfers that share it.
+
+        Each consume() call takes its bytes from the bucket, which refills
+        at the current rate up to burst bytes.  A caller that overdraws the
+        bucket sleeps until its share has been paid back, so concurrent
+        senders are paced evenly rather than in bursts.
+
+        The rate may differ by time of day, with windows like the player's
+        NETIC.BandwidthThrottleWindowOpen/Close settings.  Assign a limiter
+        to soaplib.default_limiter to apply it to every put() in the process.
+
+        Example:
+            limiter = soaplib.RateLimiter(512 * 1024)   # 512 KiB/s
+            soaplib.put(filename, url, authstr, limiter=limiter)
+
+            # 256 KiB/s during office hours only
+            soaplib.default_limiter = soaplib.RateLimiter(None,
+                windows=[ ('08:00', '18:00', 256 * 1024) ])
+    '''
+    def __init__(self, rate, burst=None, windows=None):
+        '''
+            Arguments:
+                rate        - Bytes per second, None for no limit.
+            Options:
+                burst       - Bytes that may be sent at once after an idle
+                              period, default a quarter second of the rate.
+                windows     - A list of (open, close, rate) tuples, times
+                              given as "HH:MM" local time.  The rate of the
+                              first window open at the time replaces the
+                              rate argument.  A window may span midnight.
+        '''
+        self.rate = rate and float(rate) or None
+        self.burst = burst
+        self.windows = []
+        for opentime, closetime, winrate in windows or ():
+            self.windows.append( (_minutes(opentime), _minutes(closetime),
+                winrate and float(winrate) or None) )
+        self._tokens = None                     # a full bucket
+        self._stamp = time.time()
+        self._lock = threading.Lock()
+
+    def current_rate(self, now=None):
+        'Returns the rate in effect at the time now, None if unlimited.'
+        if not self.windows:  return self.rate
+        now = time.localtime(now)
+        minute = now.tm_hour * 60 + now.tm_min
+        for opentime, closetime, rate in self.windows:
+            if opentime <= closetime:   inside = opentime <= minute < closetime
+            else:       inside = minute >= opentime or minute < closetime
+            if inside:  return rate
+        return self.rate
+
+    def consume(self, nbytes):
+        'Take nbytes from the bucket, waiting as long as needed.'
+        wait = 0
+        self._lock.acquire()
+        try:
+            now = time.time()
+            rate = self.current_rate(now)
+            if rate:
+                burst = self.burst or rate / 4
+                if self._tokens is None:
+                    tokens = burst
+                else:
+                    tokens = min(self._tokens + (now - self._stamp) * rate,
+                        burst)
+                self._tokens = tokens - nbytes
+                wait = -self._tokens / rate
+            else:
+                self._tokens = None
+            self._stamp = now
+        finally:
+            self._lock.release()
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _minutes(timestr):
+    'Returns the minutes since midnight of a "HH:MM" string.'
+    hours, minutes = timestr.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+default_limiter = None  # a RateLimiter applied to put() when none is given
+
+
+class StreamedResponse(object):
+    '''
+        A file-like response body, read straight from the socket.
+
+        Returned as the body by post(..., stream=True).  The connection goes
+        back to its pool once the body has been read to the end, call
+        close() to give up on a partially read body.
+    '''
+    def __init__(self, resp, pool, proto, host, conn):
+        self._resp = resp
+        self._release = lambda reusable: pool.release(proto, host, conn,
+            reusable and not resp.will_close)
+
+    def read(self, amt=None):
+        if self._resp is None:
+            return ''
+        try:
+            data = self._resp.read(amt)
+        except:
+            self._finish(False)
+            raise
+        if not data or self._resp.isclosed():   # body fully consumed
+            self._finish(True)
+        return data
+
+    def _finish(self, reusable):
+        self._resp = None
+        self._release(reusable)
+
+    def close(self):
+        'Discard the rest of the body, the connection is not reused.'
+        if self._resp is not None:
+            self._finish(False)
+
+    def __del__(self):
+        self.close()
+
+
 # Functions
 # ---------------------------------------------------------------------
 def _find_et():
@@ -52,42 +321,103 @@ def _find_et():
 et = _find_et()
 
 
-def dict2xml(d, indent=4, envelope=''):
-    'Given a python dictionary, return an indented XML-string representation.'
+def _xmlescape(value):
+    'Convert a value to text for an XML element.'
+    valtype = type(value)
+    if valtype is not unicode and valtype is not str:
+        value = str(value)
+    if '&' in value or '<' in value or '>' in value:
+        value = value.replace('&', '&amp;').replace('<', '&lt;').replace(
+            '>', '&gt;')
+    return value
 
+
+def _write_xml(d, write, indent=4, envelope=''):
+    'Writes the XML representation of a dictionary, see dict2xml.'
     if type(d) != dict:
         raise TypeError('Value is not a dictionary: %s' % d )
 
     tab = '    '
-    spacing = tab * indent
-
-    # handle start tag
-    if envelope:    result = '%s<%s>\n' % (spacing, envelope)  # start tag
-    else:           result = ''
+    outer = tab * indent
+    if envelope:
+        write('%s<%s>\n' % (outer, envelope))     # start tag
+        inner = outer + tab
+    else:
+        inner = outer
 
     # handle enclosed tags
-    keys = d.keys(); keys.sort()
-    for i, key in enumerate(keys):
-        spacing = tab * indent
-        if envelope:
-            spacing += tab
-
-        valtype = type(d[key])
+    keys = d.keys(); keys.sort()    # a stable order, as the CM has seen it
+    for key in keys:
+        value = d[key]
+        valtype = type(value)
         if valtype is dict:    # TO is a dict, run it again
-            result += dict2xml( d[key], envelope=key )
+            _write_xml(value, write, envelope=key)
         elif valtype is list:  # if array, expand it
-            for j, listitem in enumerate( d[key] ):
+            spacing = inner
+            for j, listitem in enumerate(value):
                 if not envelope:
                     if j == 0:  spacing = ''
-                    else:       spacing = tab * indent
-                result += '%s<%s>%s</%s>\n' % (spacing, key, listitem, key)
+                    else:       spacing = outer
+                if type(listitem) is dict:
+                    _write_xml(listitem, write, envelope=key)
+                else:
+                    write('%s<%s>%s</%s>\n' % (spacing, key,
+                        _xmlescape(listitem), key))
         else:
-            result += '%s<%s>%s</%s>\n' % (spacing, key, d[key], key)
+            write('%s<%s>%s</%s>\n' % (inner, key, _xmlescape(value), key))
 
-    # handle end tag
-    spacing = tab * indent
-    if envelope:    result += '%s</%s>\n' % (spacing, envelope)   # end tag
-    return result
+    if envelope:
+        write('%s</%s>\n' % (outer, envelope))    # end tag
+
+
+def dict2xml(d, indent=4, envelope=''):
+    'Given a python dictionary, return an indented XML-string representation.'
+    result = []
+    _write_xml(d, result.append, indent, envelope)
+    return ''.join(result)
+
+
+def _utf8(text):
+    'Encode unicode text for sending, byte strings are sent as they are.'
+    if type(text) is unicode:
+        return text.encode('utf-8', 'replace')
+    return text
+
+
+def _envelope_parts(function, xmlns):
+    '''
+        Returns the UTF-8 encoded SOAP envelope for a function, split into
+        the text before and after its arguments.  Cached per function.
+    '''
+    key = (function, xmlns)
+    parts = _envelopes.get(key)
+    if parts is None:
+        text = soap_envelope % dict(function=function, xmlns=xmlns,
+            argtext='\0')
+        parts = tuple(text.encode('utf-8').split('\0'))
+        _envelopes[key] = parts
+    return parts
+
+
+def soap_body(function, xmlns, soapargs, blocksize=4096):
+    '''
+        Serialize a SOAP call without building the whole message as one
+        string.  Returns the list of UTF-8 encoded blocks of the message,
+        each holding about blocksize elements, and its total length.
+    '''
+    prefix, suffix = _envelope_parts(function, xmlns)
+    blocks = [prefix]
+    parts = []
+    write = parts.append
+    for arg in soapargs:
+        _write_xml(arg, write)
+        if len(parts) >= blocksize:
+            blocks.append(_utf8(''.join(parts)))
+            del parts[:]
+    if parts:
+        blocks.append(_utf8(''.join(parts)))
+    blocks.append(suffix)
+    return blocks, sum(map(len, blocks))
 
 
 def nodes2dict(parentnode):
@@ -147,6 +477,30 @@ def xml2list(xmltext, roottag):
     else:       return []
 
 
+def iterxml2list(source, roottag):
+    '''
+        Given a file-like XML source, yield the same dictionaries as xml2list
+        one at a time, as each child of roottag is parsed.  Parsed nodes are
+        discarded as soon as they are converted, so memory use does not grow
+        with the length of the list.
+    '''
+    container = None
+    depth = 0
+    for event, node in et.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if container is not None:   depth += 1
+            elif node.tag == roottag:   container = node
+        elif container is not None:
+            if node is container:       # keep parsing to drain the source
+                container = None
+                continue
+            depth -= 1
+            if depth == 0:              # a direct child is complete
+                if len(node):   yield nodes2dict(node)      # for TO's
+                elif node.text: yield {node.tag:node.text}  # single tags
+                container.clear()
+
+
 def handle_url(url, encoding='utf8'):
     'Given an url, return the host and path.'
     tup = urlparse.urlsplit(url)
@@ -157,16 +511,24 @@ def handle_url(url, encoding='utf8'):
     return proto.lower(), host, path
 
 
-def get(url, addheaders=None, authstr='', debug=False):
+def get(url, addheaders=None, authstr='', debug=False, pool=None):
     'Convenience function to GET a file from an HTTP server. Use urlopen instead.'
-    return _http_call('GET', url, addheaders, authstr, '', debug)
+    return _http_call('GET', url, addheaders, authstr, '', debug, pool)
 
 
-def put(filename, url, authstr='', chunked=True, debug=False):
+def put(filename, url, authstr='', chunked=True, debug=False, pool=None,
+    limiter=None, chunk_size=def_chunk_size, progress=None):
     '''
         PUT a file to an HTTP server.
         Arguments:
             chunked         enable chunked transfer on larger files.
+            pool            ConnectionPool to use, default: soaplib.default_pool
+            limiter         RateLimiter to pace the upload with, may be shared
+                            by concurrent uploads.
+                            default: soaplib.default_limiter
+            chunk_size      bytes read and sent at a time.
+            progress        callable(sent, total, rate) called after each
+                            send, rate being the average bytes per second.
     '''
     # decide whether to send file chunked
     clen = os.path.getsize(filename)
@@ -177,29 +539,115 @@ def put(filename, url, authstr='', chunked=True, debug=False):
 
     # send file
     dataf = file(filename, 'rb')                # throws IOError if issue
-    if chunked:     # Chunked transfer encoding, acceptance required by HTTP 1.1
-        def body(http_conn):
-            while True:
-                bytes = dataf.read(8192)
-                if not bytes: break
-                length = len(bytes)
-                http_conn.send('%X\r\n' % length)
-                if debug:
-                    http_conn.set_debuglevel(0)     # mask data send
-                    print '<filedata>'
-                http_conn.send(bytes + '\r\n')
-                if debug:   http_conn.set_debuglevel(1)
-            http_conn.send('0\r\n\r\n')
-    else:
-        body = dataf
+    if limiter is None: limiter = default_limiter
+    body = _FileBody(dataf, clen, chunked, chunk_size, limiter, progress)
+    try:
+        return _http_call('PUT', url, addheaders, authstr, body, debug, pool)
+    finally:
+        dataf.close()
 
-    response = _http_call('PUT', url, addheaders, authstr, body, debug)
-    dataf.close()
-    return response
+
+class _FileBody(object):
+    '''
+        Sends a file as a PUT request body, see put().
+
+        Chunked transfer encoding is framed in place: each block is read into
+        a reusable buffer between room for its size line and its CRLF, then
+        sent with one call, without copying the data into new strings (on
+        Python 2.6, which lacks memoryview, each block is copied in once).
+        Plain bodies over plain TCP are sent straight from a memory map of
+        the file.  The body may be sent again, e.g. on a fresh connection
+        after a stale one.
+    '''
+    _headroom = 10                              # '%X\r\n' up to 4GB chunks
+
+    def __init__(self, fileobj, length, chunked, blocksize, limiter=None,
+        progress=None):
+        self.fileobj = fileobj
+        self.length = length
+        self.chunked = chunked
+        self.chunk_size = max(1, min(blocksize, 0x7fffffff))
+        self.limiter = limiter
+        self.progress = progress
+
+    def __repr__(self):                         # as printed in debug mode
+        return '<filedata: %s bytes>' % self.length
+
+    def __call__(self, http_conn):
+        self.blocksize = self.chunk_size
+        rate = self.limiter and self.limiter.current_rate()
+        if rate:        # keep pacing smooth, about eight sends per second
+            self.blocksize = min(self.blocksize, max(8192, int(rate / 8)))
+        self.fileobj.seek(0)
+        self._sent = 0
+        self._start = time.time()
+        sendall = http_conn.sock.sendall        # skip httplib's debug output
+        if self.chunked:
+            self._send_chunked(sendall)
+        elif mmap and self.length and not isinstance(http_conn,
+            _https_types):
+            self._send_mapped(sendall)
+        else:
+            self._send_blocks(sendall)
+
+    def _sent_block(self, length):
+        'Account for a block, after it is sent.'
+        self._sent += length
+        if self.progress:
+            elapsed = time.time() - self._start
+            rate = elapsed and self._sent / elapsed or 0.0
+            self.progress(self._sent, self.length, rate)
+
+    def _send_chunked(self, sendall):
+        head, blocksize, limiter = self._headroom, self.blocksize, self.limiter
+        buf = bytearray(head + blocksize + 2)
+        if memoryview:
+            view = memoryview(buf)
+            data = view[head:head + blocksize]
+            readinto = self.fileobj.readinto
+        while True:
+            if memoryview:
+                length = readinto(data)
+            else:                               # copy in, buf can't be cut
+                block = self.fileobj.read(blocksize)
+                length = len(block)
+                buf[head:head + length] = block
+            if not length: break
+            if limiter: limiter.consume(length)
+            line = '%X\r\n' % length
+            start = head - len(line)
+            buf[start:head] = line
+            end = head + length
+            buf[end:end + 2] = '\r\n'
+            if memoryview:  sendall(view[start:end + 2])
+            else:           sendall(buffer(buf, start, end + 2 - start))
+            self._sent_block(length)
+        sendall('0\r\n\r\n')
+
+    def _send_mapped(self, sendall):
+        mapped = mmap.mmap(self.fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            blocksize, limiter = self.blocksize, self.limiter
+            for offset in xrange(0, self.length, blocksize):
+                block = buffer(mapped, offset, blocksize)
+                if limiter: limiter.consume(len(block))
+                sendall(block)
+                self._sent_block(len(block))
+        finally:
+            mapped.close()
+
+    def _send_blocks(self, sendall):
+        while True:
+            block = self.fileobj.read(self.blocksize)
+            if not block: break
+            if self.limiter: self.limiter.consume(len(block))
+            sendall(block)
+            self._sent_block(len(block))
 
 
 def post(url, addheaders=None, authstr='', body='', parameters='', filename='',
-    function='', xmlns='', soapargs=None, debug=False):
+    function='', xmlns='', soapargs=None, debug=False, pool=None,
+    stream=False, idempotent=False):
     '''
         Executes an HTTP POST call against a web server.  Supports queries from
         form data, file upload, and SOAP calls.
@@ -226,6 +674,12 @@ def post(url, addheaders=None, authstr='', body='', parameters='', filename='',
                 body        - Data to send.  Do not use with SOAP, query, or
                                 file upload options in the previous section.
                 debug       - Enable to log verbose transport information.
+                pool        - ConnectionPool to use, default: default_pool.
+                stream      - Return the body as a StreamedResponse rather
+                                than a string.
+                idempotent  - The call may safely be made twice, so it can be
+                                resent if the connection drops before the
+                                response arrives.
         Returns:
             status, reason, body, ctype - tuple
     '''
@@ -238,13 +692,10 @@ def post(url, addheaders=None, authstr='', body='', parameters='', filename='',
         if filename or parameters or body:
             raise TypeError, 'filename, parameters, body not allowed with SOAP.'
 
+        body, clen = soap_body(function, xmlns, soapargs)  # sent as is
         addheaders.append( ('SOAPAction', function) )
         addheaders.append( ('Content-Type', 'text/xml; charset=UTF-8') )
-        argtext = ''
-        for arg in soapargs:
-            argtext += dict2xml(arg)
-        argtext = argtext.strip()
-        body = soap_envelope % locals()
+        addheaders.append( ('Content-Length', str(clen)) )
 
     elif parameters:                    # posting form data/query
         if filename or body:
@@ -281,18 +732,29 @@ def post(url, addheaders=None, authstr='', body='', parameters='', filename='',
             'multipart/form-data; boundary=%s' % boundstr) )
 
     # else generic post
-    response = _http_call('POST', url, addheaders, authstr, body, debug)
+    response = _http_call('POST', url, addheaders, authstr, body, debug, pool,
+        stream, idempotent)
     if locals().get('dataf'): dataf.close()
     return response
 
 
-def _http_call(verb, url, addheaders=None, authstr='', body='', debug=False):
-    'Basic HTTP call to a server.'
-
-    import socket
+def _http_call(verb, url, addheaders=None, authstr='', body='', debug=False,
+    pool=None, stream=False, idempotent=None):
+    '''
+        Basic HTTP call to a server.  Connections are taken from, and returned
+        to, a ConnectionPool so that consecutive calls to the same host reuse
+        the socket.  A request on a reused connection that turns out to have
+        been dropped by the server is retried on a fresh connection, if the
+        body can be sent again and either the request had not been sent in
+        full, or it is idempotent (by default GET and PUT are) so that the
+        server acting on it twice is harmless.  With stream, the response
+        body is returned unread as a StreamedResponse.
+    '''
+    if idempotent is None: idempotent = verb in ('GET', 'PUT')
     if debug and st:                                # redirect stdout
         orig_stdout = sys.stdout
         sys.stdout = st.fileLogger(log, 'debug')
+    if pool is None: pool = default_pool
     proto, hoststr, path = handle_url(url)          # parse url
     if addheaders is None: addheaders = []
     if isinstance(body, basestring):
@@ -310,10 +772,65 @@ def _http_call(verb, url, addheaders=None, authstr='', body='', debug=False):
     if addheaders:
         headers = headers + addheaders
 
+    try:
+        while True:
+            http_conn, reused = pool.acquire(proto, hoststr)
+            sent = False
+            try:
+                _send_request(http_conn, verb, path, hoststr, headers, body,
+                    debug)
+                sent = True
+                result = _read_response(http_conn, debug, stream)
+            except (socket.error, httplib.BadStatusLine), e:
+                http_conn.close()
+                # a kept-alive socket may be closed by the server at any time,
+                # start over if the server can't have acted on the request,
+                # or acting on it twice does no harm.
+                if reused and _replayable(body) and (idempotent or not sent):
+                    log.debug('Stale connection to %s (%s), reconnecting.',
+                        hoststr, e)
+                    pool._count('retried')
+                    continue
+                if isinstance(e, socket.error):
+                    raise IOError, str(e)
+                raise
+            except:
+                http_conn.close()
+                raise
+            resp, respbody, reusable = result
+            if stream:
+                respbody = StreamedResponse(resp, pool, proto, hoststr,
+                    http_conn)
+            else:
+                pool.release(proto, hoststr, http_conn, reusable)
+            ctype = resp.getheader('Content-type')
+            return resp.status, resp.reason, respbody, ctype
+    finally:
+        if debug and st:  sys.stdout = orig_stdout  # restore
+
+
+def _replayable(body):
+    'Whether a request body can be sent a second time.'
+    if isinstance(body, _FileBody):
+        return True
+    if type(body) is list:
+        for item in body:
+            if not isinstance(item, str):
+                return False
+        return True
+    return isinstance(body, str)
+
+
+def _send_request(http_conn, verb, path, hoststr, headers, body, debug):
+    'Send one request, headers and body, on an open connection.'
     # -- Send -------------------------------------------------------
-    http_conn = ( httplib.HTTPSConnection(hoststr) if proto.endswith('s') else
-                  httplib.HTTPConnection(hoststr) ) # open connection
-    if debug:  http_conn.set_debuglevel(1)
+    if http_conn.sock is None:                      # new connection
+        http_conn.connect()
+        try:    # headers and body are separate sends, don't wait on Nagle
+            http_conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (socket.error, AttributeError):
+            pass
+    http_conn.set_debuglevel(debug and 1 or 0)
     http_conn.putrequest(verb, path)
     if debug:
         print 'Connect-To:', hoststr
@@ -335,36 +852,40 @@ def _http_call(verb, url, addheaders=None, authstr='', body='', debug=False):
         # elif :                   print '{\n%s' % body[:128]
         print '} -----------------------------'
 
-    try:                                            # send headers, body
-        http_conn.endheaders()
-        if type(body) is list:                      # file upload sends
-            for item in body:                       # [str, file, str]
-                http_conn.send(item)
+    http_conn.endheaders()                          # send headers, body
+    if type(body) is list:                          # file upload sends
+        for item in body:                           # [str, file, str]
+            http_conn.send(item)
+    else:
+        if verb == 'PUT' and callable(body):
+            body(http_conn)                         # file, see _FileBody
         else:
-            if verb == 'PUT' and callable(body):
-                body(http_conn)                     # chunked encoding
-            else:
-                http_conn.send(body)                # normal send
-
-        # -- Response ---------------------------------------------------
-        # fetch HTTP reply headers and the response
-        if debug:  print '\n\n=============================\n'
-        resp = http_conn.getresponse()
-        body = ''   # reset
-        # if not resp.status == 401:  # there is no body with this one
-        try:                        body = resp.read()
-        except socket.error, e:     log.warn(str(e))
-        except httplib.IncompleteRead, e:
-            log.warn('%s -- A known bug with CM typically when given an '
-                'incorrect password.' % e)
-        if debug:  print '---------------------\n'
-        ctype = resp.getheader('Content-type')
-
-        http_conn.close()
-        if debug and st:  sys.stdout = orig_stdout  # restore
-        return resp.status, resp.reason, body, ctype
+            http_conn.send(body)                    # normal send
 
-    except socket.error, e:
-        if debug and st:  sys.stdout = orig_stdout  # restore
-        raise IOError, str(e)
 
+def _read_response(http_conn, debug, stream=False):
+    '''
+        Read the response to the request sent on a connection, the whole of
+        it unless stream is given.  Returns a tuple of (response, body,
+        reusable).
+    '''
+    # fetch HTTP reply headers and the response
+    if debug:  print '\n\n=============================\n'
+    resp = http_conn.getresponse()
+    if stream:
+        return resp, None, None
+    body = ''   # reset
+    reusable = True
+    # if not resp.status == 401:  # there is no body with this one
+    try:                        body = resp.read()
+    except socket.error, e:
+        log.warn(str(e))
+        reusable = False
+    except httplib.IncompleteRead, e:
+        log.warn('%s -- A known bug with CM typically when given an '
+            'incorrect password.', e)
+        reusable = False
+    if debug:  print '---------------------\n'
+    if resp.will_close:                             # server wants to close
+        reusable = False
+    return resp, body, reusable
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+'''
+    bench_logging.py - Client-side cost of a CM call with logging at WARN.
+
+    The transport is replaced by a canned response, so the figures are the
+    time spent in scws itself: building the request, decoding the response
+    and logging.  "after" is the current code.  "before" is measured with an
+    older scws module given on the command line, run against the same canned
+    response, e.g. scws 1.31, the last to format log messages on every call
+    whatever the log level:
+
+        git show 2e3aa1e^:webservices/scws.py > /tmp/scws_131.py
+        bench_logging.py 50 200 /tmp/scws_131.py
+
+    Without one, "before" is only an estimate: the current code plus the
+    formatting that 1.31 did eagerly (the pretty-printed response, the
+    argument tuple and one message per TObj), timed separately.
+
+    Command line usage:
+        bench_logging.py [items per response] [calls] [older scws.py]
+'''
+if True:  # initialization
+    import os, sys, time
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__))))
+    import imp
+    import logging
+    import scws, soaplib
+    from xml.dom.minidom import parseString
+
+    item_xml = ('<return><id>%d</id><name>media %d.png</name>'
+        '<path>/content/promo</path><mediaType>IMAGE</mediaType>'
+        '<length>123456</length></return>')
+    response_xml = ('<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">'
+        '<soap:Body><ns2:listResponse xmlns:ns2="http://v1.2.api.cm.scala.com">'
+        '%s</ns2:listResponse></soap:Body></soap:Envelope>')
+
+
+def eager_formatting(response, arglist):
+    'The formatting done unconditionally before log calls were deferred.'
+    status, reason, body, ctype = response
+    '%s %s.%s%s' % ('v1.2', 'media', 'list', tuple(arglist))
+    'Response: %s\n' % (response,)
+    '{\n%s' % parseString(body).toprettyxml(indent='    ')
+    for adict in soaplib.xml2list(body,
+        '{http://v1.2.api.cm.scala.com}listResponse'):
+        'TObj created with: %s' % adict
+
+
+def time_calls(module, calls):
+    'Seconds per MediaRS.list call made through the given scws module.'
+    cm = module.ConManager('http://localhost:8080/ContentManager/',
+        'user:pass', api_vers='v1.2')
+    src = module.TObj(column='name', restriction='LIKE', value='%.png')
+    start = time.time()
+    for i in range(calls):
+        cm.MediaRS.list(searchCriteria=src)
+    return (time.time() - start) / calls
+
+
+def main():
+    items = 50
+    calls = 200
+    older = None
+    if len(sys.argv) > 1:   items = int(sys.argv[1])
+    if len(sys.argv) > 2:   calls = int(sys.argv[2])
+    if len(sys.argv) > 3:   older = sys.argv[3]
+
+    logging.basicConfig(level=logging.WARN)
+    body = response_xml % ''.join([ item_xml % (i, i) for i in range(items) ])
+    response = (200, 'OK', body, 'text/xml;charset=UTF-8')
+    soaplib.post = lambda *args, **kwargs: response     # no network
+
+    after = time_calls(scws, calls)
+    if older:
+        before = time_calls(imp.load_source('scws_before', older), calls)
+        label = 'before: '
+    else:
+        src = scws.TObj(column='name', restriction='LIKE', value='%.png')
+        arglist = [ {'searchCriteria':src.__get_dict__()} ]
+        start = time.time()
+        for i in range(calls):
+            eager_formatting(response, arglist)
+        before = after + (time.time() - start) / calls
+        label = 'before*:'
+
+    print '%d calls, %d items per response, logging at WARN' % (calls, items)
+    print '    %s %8.1f us/call' % (label, before * 1e6)
+    print '    after:   %8.1f us/call' % (after * 1e6)
+    print '    saved:   %8.1f%%' % (100 * (before - after) / before)
+    if not older:
+        print '    * estimated, give an older scws.py to measure it'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+'''
+    bench_put.py - Throughput of soaplib.put over loopback.
+
+    A local server reads and discards request bodies as fast as it can, so
+    the figures are bound by the client.  "before" sends the file as
+    soaplib 1.20 did, 8 KiB reads with a size line send and a concatenated
+    data send per chunk; "after" is the current put() with the default
+    chunk size, chunked and plain.
+
+    Command line usage:
+        bench_put.py [megabytes] [rounds]
+'''
+if True:  # initialization
+    import os, sys, time, socket, threading, tempfile
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__))))
+    import soaplib
+
+    response = 'HTTP/1.1 201 Created\r\nContent-Length: 0\r\n\r\n'
+    last_chunk = '\r\n0\r\n\r\n'
+
+
+def serve(listener):
+    'Accept connections, answer each request once its body is read.'
+    while True:
+        conn, addr = listener.accept()
+        thread = threading.Thread(target=handle, args=(conn,))
+        thread.setDaemon(True)
+        thread.start()
+
+
+def handle(conn):
+    buf = bytearray(1048576)
+    while True:
+        header = ''
+        while '\r\n\r\n' not in header:
+            data = conn.recv(4096)
+            if not data: return
+            header += data
+        header, rest = header.split('\r\n\r\n', 1)
+        length = int(header.split('Content-Length: ')[1].split('\r\n')[0])
+        if 'Transfer-Encoding: chunked' in header:   # until the last chunk
+            tail = rest[-len(last_chunk):]
+            while not tail.endswith(last_chunk):
+                count = conn.recv_into(buf)
+                tail = (tail + str(buf[max(0, count - 16):count]))[-16:]
+        else:
+            received = len(rest)
+            while received < length:
+                received += conn.recv_into(buf)
+        conn.sendall(response)
+
+
+def put_before(filename, url):
+    'soaplib.put as of 1.20, chunked.'
+    dataf = open(filename, 'rb')
+    def body(http_conn):
+        while True:
+            bytes = dataf.read(8192)
+            if not bytes: break
+            http_conn.send('%X\r\n' % len(bytes))
+            http_conn.send(bytes + '\r\n')
+        http_conn.send('0\r\n\r\n')
+    headers = [ ('Content-Length', str(os.path.getsize(filename))),
+        ('Transfer-Encoding', 'chunked') ]
+    try:
+        return soaplib._http_call('PUT', url, headers, '', body)
+    finally:
+        dataf.close()
+
+
+def measure(func, rounds, size):
+    'Returns MB/s of the best round.'
+    best = None
+    for i in range(rounds):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:  best = elapsed
+    return size / best / 1048576
+
+
+def main():
+    megabytes = 256
+    rounds = 3
+    if len(sys.argv) > 1:   megabytes = int(sys.argv[1])
+    if len(sys.argv) > 2:   rounds = int(sys.argv[2])
+
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(5)
+    thread = threading.Thread(target=serve, args=(listener,))
+    thread.setDaemon(True)
+    thread.start()
+    url = 'http://127.0.0.1:%d/upload.bin' % listener.getsockname()[1]
+
+    handle, filename = tempfile.mkstemp()
+    block = os.urandom(1048576)
+    for i in range(megabytes):
+        os.write(handle, block)
+    os.close(handle)
+    size = os.path.getsize(filename)
+    try:
+        print '%d MB over loopback, best of %d            MB/s' % (
+            megabytes, rounds)
+        print '    before, chunked 8 KiB         %8.1f' % measure(
+            lambda: put_before(filename, url), rounds, size)
+        print '    after,  chunked %3d KiB       %8.1f' % (
+            soaplib.def_chunk_size / 1024, measure(
+            lambda: soaplib.put(filename, url), rounds, size))
+        print '    after,  plain (mmap)          %8.1f' % measure(
+            lambda: soaplib.put(filename, url, chunked=False), rounds, size)
+    finally:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    main()
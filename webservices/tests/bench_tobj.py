@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+'''
+    bench_tobj.py - Memory and throughput of MediaTO against plain TObj.
+
+    Builds the given number of media transfer objects from dictionaries as
+    returned by the SOAP decoder, then times attribute access and conversion
+    back to dictionaries (as done when passing objects as arguments).  Memory
+    is the size of the instances and their attribute dictionaries, the field
+    values themselves are shared and not counted.
+
+    Command line usage:
+        bench_tobj.py [number of objects]
+'''
+if True:  # initialization
+    import os, sys, time
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__))))
+    import scws
+
+
+def instance_size(obj):
+    'Size in bytes of an object and its attribute dictionaries.'
+    size = sys.getsizeof(obj)
+    if isinstance(obj, scws._TypedTObj):
+        if obj._extra is not None:  size += sys.getsizeof(obj._extra)
+    else:
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def run(cls, dicts):
+    'Returns (bytes per object, us to build, us to read, us to convert).'
+    start = time.time()
+    objs = [ cls(**adict) for adict in dicts ]
+    built = time.time() - start
+
+    start = time.time()
+    for obj in objs:
+        obj.id, obj.name, obj.path, obj.mediaType, obj.length, obj.missing
+    read = time.time() - start
+
+    start = time.time()
+    for obj in objs:
+        obj.__get_dict__()
+    converted = time.time() - start
+
+    size = sum([ instance_size(obj) for obj in objs ])
+    count = float(len(objs))
+    return (size / count, built / count * 1e6, read / count * 1e6,
+        converted / count * 1e6)
+
+
+def main():
+    count = 50000
+    if len(sys.argv) > 1:   count = int(sys.argv[1])
+
+    dicts = [ dict(_typestr='return', id=str(i), name='media %d.png' % i,
+        path='/content/promo', mediaType='IMAGE', length='123456',
+        width='1920', height='1080', revision='3', status='OK',
+        lastModified='2013-07-30T12:00:00Z') for i in range(count) ]
+
+    print '%d media objects        bytes/obj  build us  read us  to-dict us' % (
+        count)
+    for cls in (scws.TObj, scws.MediaTO):
+        print '    %-20s %9.0f %9.2f %8.2f %11.2f' % (
+            (cls.__name__,) + run(cls, dicts))
+
+
+if __name__ == '__main__':
+    main()